@@ -2,6 +2,9 @@ import dash
 from dash import html, Dash, dcc
 import dash_bootstrap_components as dbc
 
+from utils.timing import init_app as init_timing
+from utils.prewarm import init_app as init_prewarm
+
 app = Dash(
     __name__, 
     use_pages = True, 
@@ -25,5 +28,11 @@ app.layout = html.Div([
 
 server = app.server
 
+# Server-Timing headers and timing log lines for every callback request
+init_timing(server)
+
+# Warm up the charts of every FY in the background, /ready reports when it is done
+init_prewarm(server)
+
 if __name__ == '__main__':
     app.run(debug = False, port = 8050)
@@ -0,0 +1,20 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    money_moved: {
+        // Builds the figure of the selected amount type from the shared figure and the data of each amount type
+        // sent by the server (see Figure.create_figure_variants)
+        select_amount_type_figure: function(figures, amountType) {
+            if (!figures || !figures.variants || !figures.variants[amountType]) {
+                return window.dash_clientside.no_update;
+            }
+            var variant = figures.variants[amountType];
+            var data = variant.data || figures.figure.data.map(function(trace, i) {
+                return Object.assign({}, trace, variant.traces[i]);
+            });
+            return {data: data, layout: Object.assign({}, figures.figure.layout, variant.layout)};
+        },
+        // Polls the AI insight jobs only while there are pending jobs
+        poll_while_pending: function(pendingJobIds) {
+            return !(pendingJobIds && pendingJobIds.length);
+        }
+    }
+});
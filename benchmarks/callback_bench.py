@@ -0,0 +1,281 @@
+"""
+Latency benchmark of the Money Moved page callbacks, run directly without a browser.
+
+Every callback is swept over all FYs, amount types, drilldown options, top N slider values and Sankey view modes.
+Each (dataset, callback) runs in its own worker process, so the peak RSS is that of one callback and the
+DataLoader singleton reads the dataset directory given by OFTW_DATA_DIR.
+
+Reported per callback: p50/p95/p99 latency, peak RSS and the serialized (JSON) size of the callback outputs,
+plus the p50 of the utils.timing stages (query, figure, logos, ...) to show where the time goes.
+
+Datasets:
+- shipped: the data/ directory of the repo
+- x<scale>, e.g. x10: synthetic data from utils.synthetic_data, generated into benchmarks/.data/ on first use
+
+Usage:
+    python -m benchmarks.callback_bench --dataset shipped --dataset x10
+    python -m benchmarks.callback_bench --dataset shipped --save-baseline
+    python -m benchmarks.callback_bench --dataset shipped --compare --threshold 0.2
+"""
+import numpy as np
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+SYNTHETIC_DATA_DIR = Path(__file__).resolve().parent / ".data"
+
+CALLBACKS = [
+    "update_money_moved_cards",
+    "update_mm_cumulative_graph",
+    "update_reoccuring_vs_onetime_graph",
+    "update_chapter_dumbell_graph",
+    "update_mm_heatmap_graph",
+    "update_mm_monthly_trendline",
+    "update_active_pledge_arr_sankey",
+]
+
+# Metrics compared against the baseline; latency differences below the floor are treated as noise
+COMPARED_METRICS = ["p50_ms", "p95_ms", "p99_ms", "rss_peak_mb", "payload_max_kb"]
+LATENCY_FLOOR_MS = 2.0
+
+
+def build_sweep(callback_name):
+    """
+    Returns the list of argument tuples the callback is called with: every combination of its page controls.
+    """
+    from pages.layouts.moneymoved_layout import unique_fy, drilldown_by
+
+    drilldowns = [""] + [item["value"] for item in drilldown_by]
+    topn_values = list(range(3, 51))
+    view_modes = ["actual", "target"]
+
+    if callback_name in ("update_money_moved_cards", "update_mm_cumulative_graph", "update_reoccuring_vs_onetime_graph", "update_mm_heatmap_graph"):
+        return [(fy,) for fy in unique_fy]
+    if callback_name == "update_chapter_dumbell_graph":
+        return [(fy, topn) for fy in unique_fy for topn in topn_values]
+    if callback_name == "update_mm_monthly_trendline":
+        return [(fy, drilldown) for fy in unique_fy for drilldown in drilldowns]
+    if callback_name == "update_active_pledge_arr_sankey":
+        return [(fy, view_mode) for fy in unique_fy for view_mode in view_modes]
+
+    raise ValueError(f"Unknown callback {callback_name}")
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+
+def run_worker(callback_name, repeat):
+    """
+    Imports the app, runs the sweep of one callback and returns its samples. Runs inside the worker process.
+    """
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict, to_json
+
+    import app  # noqa: F401, registers the pages and their callbacks
+    import importlib
+    from utils import timing
+    money_moved = importlib.import_module("pages.money_moved")
+
+    rss_import_mb = _peak_rss_mb()
+    # @callback registers the function and returns it unchanged, so it can be called directly
+    callback_fn = getattr(money_moved, callback_name)
+    sweep = build_sweep(callback_name)
+
+    latencies_ms = []
+    payload_bytes = []
+    stages_ms = {}
+    errors = {}
+    for _ in range(repeat):
+        for args in sweep:
+            # Outside of a request Dash has no callback context; the FY filter is reported as the trigger
+            context_value.set(AttributeDict(triggered_inputs = [{"prop_id": "fy-filter.value", "value": args[0]}]))
+
+            start = time.perf_counter()
+            try:
+                with timing.record() as timings:
+                    outputs = callback_fn(*args)
+            except Exception as e:
+                # Failing calls are reported, not timed
+                errors.setdefault(f"{type(e).__name__}: {e}", []).append(repr(args[:3]))
+                continue
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+
+            for name, duration_ms in timings.durations_ms.items():
+                stages_ms.setdefault(name, []).append(duration_ms)
+
+            payload_bytes.append(len(to_json(outputs)))
+
+    return {
+        "calls": len(latencies_ms),
+        "errors": errors,
+        "latencies_ms": latencies_ms,
+        "payload_bytes": payload_bytes,
+        "stages_ms": stages_ms,
+        "rss_import_mb": rss_import_mb,
+        "rss_peak_mb": _peak_rss_mb(),
+    }
+
+
+def summarize(samples):
+    """
+    Returns the reported metrics of one callback from the worker samples.
+    """
+    latencies_ms = np.array(samples["latencies_ms"])
+    payload_kb = np.array(samples["payload_bytes"]) / 1024
+
+    return {
+        "calls": samples["calls"],
+        "errors": sum(len(error_args) for error_args in samples["errors"].values()),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max_ms": round(float(latencies_ms.max()), 2),
+        "rss_import_mb": round(samples["rss_import_mb"], 1),
+        "rss_peak_mb": round(samples["rss_peak_mb"], 1),
+        "payload_p50_kb": round(float(np.percentile(payload_kb, 50)), 1),
+        "payload_max_kb": round(float(payload_kb.max()), 1),
+        # Exclusive time per utils.timing stage (query, figure, logos, llm, callback); a stage may not run on every call
+        "stages_p50_ms": {name: round(float(np.percentile(durations_ms, 50)), 2) for name, durations_ms in samples["stages_ms"].items()},
+    }
+
+
+def resolve_data_dir(dataset):
+    """
+    Returns the data directory of a dataset name, generating synthetic data when needed.
+    """
+    if dataset == "shipped":
+        return ROOT_DIR / "data"
+
+    if not dataset.startswith("x"):
+        raise ValueError(f"Unknown dataset {dataset}, expected 'shipped' or x<scale>, e.g. x10")
+
+    data_dir = SYNTHETIC_DATA_DIR / dataset
+    if not (data_dir / "merged.parquet").exists():
+        from utils.synthetic_data import generate
+        print(f"Generating synthetic dataset {dataset} in {data_dir}")
+        generate(float(dataset[1:]), data_dir)
+
+    return data_dir
+
+
+def run_callback(dataset, callback_name, repeat):
+    """
+    Runs one callback sweep in a fresh worker process against the dataset and returns its summary.
+    """
+    # Without the startup warm-up, so the sweep measures the cold and cached paths itself
+    env = dict(os.environ, OFTW_DATA_DIR = str(resolve_data_dir(dataset)), PREWARM = "0")
+
+    with tempfile.NamedTemporaryFile(suffix = ".json") as output_file:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.callback_bench", "--worker", callback_name, "--repeat", str(repeat), "--output", output_file.name],
+            cwd = ROOT_DIR,
+            env = env,
+            check = True,
+            stdout = subprocess.DEVNULL,
+        )
+        with open(output_file.name, "r") as f:
+            samples = json.load(f)
+
+    for error, error_args in samples["errors"].items():
+        print(f"{callback_name} failed {len(error_args)}x with {error}, e.g. for {error_args[0]}")
+
+    return summarize(samples)
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the list of regressions: metrics which grew by more than threshold (e.g. 0.2 = 20%) over the baseline.
+    """
+    regressions = []
+    for callback_name, metrics in results.items():
+        baseline_metrics = baseline.get("callbacks", {}).get(callback_name)
+        if baseline_metrics is None:
+            continue
+
+        if metrics["errors"] > baseline_metrics.get("errors", 0):
+            regressions.append(f"{callback_name} errors: {baseline_metrics.get('errors', 0)} -> {metrics['errors']}")
+
+        for metric in COMPARED_METRICS:
+            current, previous = metrics[metric], baseline_metrics[metric]
+            if metric.endswith("_ms") and current - previous < LATENCY_FLOOR_MS:
+                continue
+            if current > previous * (1 + threshold):
+                regressions.append(f"{callback_name} {metric}: {previous} -> {current} (+{(current / previous - 1) * 100:.0f}%)")
+
+    return regressions
+
+
+def print_results(dataset, results):
+    columns = ["calls", "errors", "p50_ms", "p95_ms", "p99_ms", "rss_peak_mb", "payload_p50_kb", "payload_max_kb"]
+    print(f"\n{dataset}")
+    print(f"{'callback':<34}" + "".join(f"{column:>15}" for column in columns))
+    for callback_name, metrics in results.items():
+        print(f"{callback_name:<34}" + "".join(f"{metrics[column]:>15}" for column in columns))
+        print(f"{'':<34}stages p50: " + ", ".join(f"{name} {duration_ms} ms" for name, duration_ms in metrics.get("stages_p50_ms", {}).items()))
+
+
+def environment_info():
+    import polars as pl
+    return {
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the Money Moved page callbacks.")
+    parser.add_argument("--dataset", action = "append", help = "shipped or x<scale>, can be repeated (default: shipped)")
+    parser.add_argument("--callback", action = "append", choices = CALLBACKS, help = "Callback to run, can be repeated (default: all)")
+    parser.add_argument("--repeat", type = int, default = 1, help = "Number of passes over the sweep")
+    parser.add_argument("--save-baseline", action = "store_true", help = "Store the results as the baseline of each dataset")
+    parser.add_argument("--compare", action = "store_true", help = "Compare with the stored baselines, exit with 1 on regressions")
+    parser.add_argument("--threshold", type = float, default = 0.2, help = "Allowed relative growth of a metric over the baseline")
+    parser.add_argument("--worker", choices = CALLBACKS, help = argparse.SUPPRESS)
+    parser.add_argument("--output", help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        samples = run_worker(args.worker, args.repeat)
+        with open(args.output, "w") as f:
+            json.dump(samples, f)
+        sys.exit(0)
+
+    all_regressions = []
+    for dataset in args.dataset or ["shipped"]:
+        results = {callback_name: run_callback(dataset, callback_name, args.repeat) for callback_name in args.callback or CALLBACKS}
+        print_results(dataset, results)
+
+        baseline_path = BASELINE_DIR / f"{dataset}.json"
+
+        if args.compare:
+            if not baseline_path.exists():
+                print(f"No baseline for {dataset}, run with --save-baseline first")
+                continue
+            with open(baseline_path, "r") as f:
+                regressions = compare(results, json.load(f), args.threshold)
+            for regression in regressions:
+                print(f"REGRESSION {dataset} {regression}")
+            all_regressions.extend(regressions)
+
+        if args.save_baseline:
+            BASELINE_DIR.mkdir(exist_ok = True)
+            with open(baseline_path, "w") as f:
+                json.dump({"environment": environment_info(), "repeat": args.repeat, "callbacks": results}, f, indent = 2)
+            print(f"Saved baseline {baseline_path}")
+
+    sys.exit(1 if all_regressions else 0)
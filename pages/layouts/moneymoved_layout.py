@@ -4,6 +4,7 @@ import dash_bootstrap_components as dbc
 import dash_draggable
 
 from utils.data_preparer import DataPreparer
+from utils.insight_messages import insight_messages
 
 data_preparer = DataPreparer()
 
@@ -37,10 +38,6 @@ def chart_header_title_with_ai(chart_id, title):
     component = html.Div(
         className="d-flex justify-content-between align-items-center w-100",
         children=[
-            dcc.Store(
-                id="ai-message-store",
-                data=[],
-            ),
             dbc.Row(
                 class_name="d-flex justify-content-between align-items-center w-100",
                 children=[
@@ -506,6 +503,10 @@ def moneymoved_layout():
                                                                                             html.Div(
                                                                                                 className="table bordered-table mb-0 dataTable",
                                                                                                 children=[
+                                                                                                    # The shared figure and the data of both amount types, the amount type radio picks one in the browser
+                                                                                                    dcc.Store(
+                                                                                                        id="money-moved-cumulative-figures",
+                                                                                                    ),
                                                                                                     dcc.Graph(
                                                                                                         id="money-moved-cumulative-graph",
                                                                                                         style={
@@ -750,6 +751,10 @@ def moneymoved_layout():
                                                                                             html.Div(
                                                                                                 className="table bordered-table mb-0 dataTable",
                                                                                                 children=[
+                                                                                                    # The shared figure and the data of both amount types, the amount type radio picks one in the browser
+                                                                                                    dcc.Store(
+                                                                                                        id="money-moved-line-figures",
+                                                                                                    ),
                                                                                                     dcc.Graph(
                                                                                                         id="money-moved-line-graph",
                                                                                                         style={
@@ -1058,6 +1063,30 @@ def moneymoved_layout():
                                                                     ),
                                                                 ],
                                                             ),
+                                                            # The AI insights of the session are kept on the server, the client only holds
+                                                            # the session id and the version of its insights. The session id and the pending jobs
+                                                            # are kept in the browser tab's sessionStorage, which takes precedence over the data
+                                                            # of a new render, so they survive reloads and navigating away from the page.
+                                                            dcc.Store(
+                                                                id="ai-session-id",
+                                                                storage_type="session",
+                                                                data=insight_messages.new_session_id(),
+                                                            ),
+                                                            dcc.Store(
+                                                                id="ai-message-store",
+                                                                data=0,
+                                                            ),
+                                                            # Pending AI insight jobs, polled until their insight is ready
+                                                            dcc.Store(
+                                                                id="ai-job-store",
+                                                                storage_type="session",
+                                                                data=[],
+                                                            ),
+                                                            dcc.Interval(
+                                                                id="ai-job-poll",
+                                                                interval=250,
+                                                                disabled=True,
+                                                            ),
                                                             # Floating Draggable AI Panel
                                                             dbc.Modal(
                                                                 id="ai-modal",
@@ -1087,6 +1116,10 @@ def moneymoved_layout():
                                                                                         ),
                                                                                         
                                                                                         html.Hr(),
+                                                                                        # Insights being streamed, above the finished ones
+                                                                                        html.Div(
+                                                                                            id="ai-stream-output",
+                                                                                        ),
                                                                                         dcc.Loading(
                                                                                             id="ai-loading",
                                                                                             type="default",  # or "dot", "circle"
@@ -1,23 +1,25 @@
 import dash
-from dash import Input, Output, callback, ctx, html, ALL, State, dcc
+from dash import Input, Output, callback, clientside_callback, ClientsideFunction, ctx, html, ALL, State, dcc, Patch
 
 import polars as pl
-import numpy as np
-import plotly.graph_objects as go
 
-from utils.data_loader import data_loader
-from utils.data_preparer import DataPreparer
-from utils.figure import Figure
-from utils.dumbbell_with_logos import create_dumbell_chart_with_logos
-from utils.logo_utils import get_logo_as_base64, find_best_logo_match
+from utils.data_loader import data_loader, EXCLUDED_PORTFOLIOS
+from utils.data_preparer import DataPreparer, LLM_STREAM, INSIGHT_ENGINE
+from utils.figure import Figure, figure_cache
+from utils.dumbbell_with_logos import create_dumbell_chart_with_logos, get_dumbell_chart_data
+from utils.logo_utils import logo_dir
+from utils.timing import timed
+from utils.prewarm import prewarmer
+from utils.insight_jobs import insight_jobs, JOB_DONE, JOB_ERROR
+from utils.insight_messages import insight_messages
+from utils.insight_digest import chart_digest
+from utils.local_insights import insight_engine
 
 from pages.layouts import moneymoved_layout
 
 import json
-from pathlib import Path
 
 # Load logo mappings from file
-logo_dir = Path("/home/dhb/dash_oftp/downloaded_logos")
 mapping_file = logo_dir / "logo_mapping.json"
 
 if mapping_file.exists():
@@ -54,6 +56,7 @@ def layout(**kwargs):
         State("ai-modal", "is_open"),
     ],
 )
+@timed("callback")
 def toggle_ai_modal(ai_icon_click_list, is_ai_modal_open):
     triggered_id = ctx.triggered_id
 
@@ -65,72 +68,22 @@ def toggle_ai_modal(ai_icon_click_list, is_ai_modal_open):
     return is_ai_modal_open
 
 
-@callback(
-    Output("money-moved-card", "children"),
-    Output("cf-money-moved-card", "children"),
-    Output("money-moved-cumulative-graph", "figure"),
-    Output("recurring-money-moved-bar-graph", "figure"),
-    Output("chapter-dumbell-graph", "figure"),
-    # Output("cf-money-moved-cumulative-graph", "figure"),
-    # Output("money-moved-mosaic-graph", "figure"),
-    Output("money-moved-heatmap-graph", "figure"),
-    Output("ai-message-store", "data", allow_duplicate = True),
-    Input("fy-filter", "value"),
-    Input("mm-cf-cumulative-radio-filter", "value"),
-    Input("topn-chapter-slider", "value"),
-    # Input("payment-platform-filter", "value"),
-    # Input("chapter-type-filter", "value"),
-    Input({"type": "ai-icon", "chart": ALL}, "n_clicks"),
-    [
-        State("ai-message-store", "data"),
-    ],
-    prevent_initial_call = "initial_duplicate"
-)
-def update_kpis_graphs(selected_fy, selected_amount_type, topn_donor_chapter_value, ai_icon_clicks_list, existing_ai_messages):
-    triggered_id = ctx.triggered_id
-    chart_insight = None
-
-    # Check if the triggered_id is a dictionary and has a "type" key
-    # This is to check if the triggered_id is from the ai-icon
-    if triggered_id and isinstance(triggered_id, dict) and "type" in triggered_id:
-        chart_insight = triggered_id.get("chart")
-
-    filters = []     
-
-    fund_raise_target = 1_800_000
-    cf_fund_raise_target = 1_260_000
-
-    if selected_fy:
-        filters.append(("payment_date_fy", "==", selected_fy))
-
-    # if selected_payment_platform:
-    #     filters.append(("payment_platform", "in", selected_payment_platform))
-
-    # if selected_chapter_type:
-    #     filters.append(("pledge_chapter_type", "in", selected_chapter_type))
-
-    merged_lf = data_preparer.filter_data("merged", filters)
-
-    money_moved_lf = (merged_lf
-                   .select(["payment_date_fy", "payment_date_fm", "payment_date_calendar_year", "payment_date_calendar_month", "payment_date_calendar_monthname", 
-                            "payment_date_calendar_monthyear", "payment_date_day_of_week", "payment_date_week_of_fy", "pledge_status", "pledge_chapter_type", 
-                            "payment_portfolio", "payment_platform", "payment_date", "payment_amount_usd", "payment_cf_amount_usd", "pledge_frequency_type"
-                    ])
-                   .filter(~pl.col("payment_portfolio").is_in(["One for the World Discretionary Fund", "One for the World Operating Costs"]))
-                   .sort("payment_date_fm")
-                )
-
-    # mm FYTD
-    money_moved_ytd_value = money_moved_lf.select(pl.col("payment_amount_usd").sum()).collect().item()
-    mm_card = figure_instance.create_kpi_card(money_moved_ytd_value, goal = fund_raise_target, body_text = "Money Moved FYTD")
-
-    # cf mm FYTD
-    cf_money_moved_ytd_value = money_moved_lf.select(pl.col("payment_cf_amount_usd").sum()).collect().item()
-    cf_mm_card = figure_instance.create_kpi_card(cf_money_moved_ytd_value, goal = cf_fund_raise_target, body_text = "CF Money Moved FYTD")
+FUND_RAISE_TARGET = 1_800_000
+CF_FUND_RAISE_TARGET = 1_260_000
 
+# Values of the amount type radios (mm-cf-cumulative-radio-filter, mm-cf-radio-filter)
+AMOUNT_TYPES = ["payment_amount_usd", "payment_cf_amount_usd"]
 
+# Per-FY aggregates of the rollup cube shared by the KPI cards, the cumulative graph and the recurring bar graph.
+# They are collected together on the first request of a FY and served from the result cache afterwards.
+money_moved_fy_plans = {
+    # mm FYTD / cf mm FYTD
+    "kpis": lambda lf: lf.select([
+        pl.col("payment_amount_usd").sum(),
+        pl.col("payment_cf_amount_usd").sum(),
+    ]),
     # money moved monthly
-    money_moved_ytd_df = (money_moved_lf
+    "monthly": lambda lf: (lf
         .group_by(["payment_date_fm", "payment_date_calendar_month", "payment_date_calendar_monthyear"])
         .agg([
             pl.col("payment_amount_usd").sum().alias("money_moved_monthly"),
@@ -141,178 +94,591 @@ def update_kpis_graphs(selected_fy, selected_amount_type, topn_donor_chapter_val
             pl.cum_sum("money_moved_monthly").alias("money_moved_cumulative"),
             pl.cum_sum("cf_money_moved_monthly").alias("cf_money_moved_cumulative"),
         ])
-        .collect()
+    ),
+    # Recurring vs One-Time
+    "reoccuring": lambda lf: (lf
+        .group_by(["payment_date_fm", "payment_date_calendar_month", "payment_date_calendar_monthyear", "pledge_frequency_type"])
+        .agg([
+            pl.col("payment_amount_usd").sum().alias("money_moved_usd"),
+        ])
+        .sort(["payment_date_fm", "pledge_frequency_type"])
+    ),
+}
+
+
+def get_fy_filters(selected_fy, fy_col_name = "payment_date_fy"):
+    filters = []
+
+    if selected_fy:
+        filters.append((fy_col_name, "==", selected_fy))
+
+    return filters
+
+
+def get_money_moved_fy_data(selected_fy):
+    """
+    Returns the per-FY Money Moved aggregates (kpis, monthly, reoccuring) from the rollup cube,
+    which already excludes the non money moved portfolios.
+    """
+    return data_preparer.collect_filtered_bundle("merged_rollup", money_moved_fy_plans, get_fy_filters(selected_fy), plan_key = "money_moved_fy")
+
+
+def merged_version():
+    return data_loader.get_fingerprint("merged")
+
+
+def pledge_active_arr_version():
+    return data_loader.get_fingerprint("pledge_active_arr")
+
+
+def get_prior_fy(selected_fy):
+    return f"FY{int(selected_fy[2:6]) - 1}-{int(selected_fy[7:]) - 1}"
+
+
+def get_mm_daily_data(selected_fy):
+    """
+    Returns the money moved per day of the FY (at most 366 rows), the source of the calendar heatmap.
+    """
+    return data_preparer.collect_filtered(
+        "merged",
+        get_fy_filters(selected_fy) + [("payment_portfolio", "not_in", EXCLUDED_PORTFOLIOS)],
+        ["payment_date_fm", "payment_date_calendar_monthname", "payment_date_day_of_week", "payment_date_week_of_fy", "payment_date", "payment_amount_usd"],
+        lambda lf: (lf
+            .group_by(["payment_date", "payment_date_fm", "payment_date_calendar_monthname", "payment_date_day_of_week", "payment_date_week_of_fy"])
+            .agg(pl.col("payment_amount_usd").sum())
+            .sort("payment_date")
+        ),
+        plan_key = "mm_daily",
     )
 
-    mm_monthly_fig = go.Figure()
+
+def get_mm_monthly_data(selected_fy, selected_drilldown_by):
+    """
+    Returns the money moved of both amount types per fiscal month (and drilldown value) from the rollup cube,
+    the source of the monthly trendline of either amount type.
+    """
+    group_cols = ["payment_date_fm", "payment_date_calendar_month", "payment_date_calendar_monthyear"] + ([selected_drilldown_by] if selected_drilldown_by else [])
+
+    return data_preparer.collect_filtered(
+        "merged_rollup",
+        get_fy_filters(selected_fy),
+        plan = lambda lf: lf.group_by(group_cols).agg(pl.col(AMOUNT_TYPES).sum()).sort("payment_date_fm"),
+        plan_key = ("mm_monthly", selected_drilldown_by),
+    )
+
+
+def get_pledge_active_arr_data(selected_fy):
+    return data_preparer.collect_filtered("pledge_active_arr", get_fy_filters(selected_fy, "pledge_starts_at_fy"))
+
+
+# Chart builders, memoized in the server-side figure cache by (chart_id, parameters).
+
+@figure_cache.memoize("money-moved-cumulative-graph", merged_version)
+def build_mm_cumulative_graph(selected_fy, selected_amount_type):
+    # money moved monthly
+    money_moved_ytd_df = get_money_moved_fy_data(selected_fy)["monthly"]
 
     if "cf" in selected_amount_type:
-        mm_monthly_fig = figure_instance.create_monthly_mm_graph(money_moved_ytd_df, "cf_money_moved_cumulative", cf_fund_raise_target)
-    else:
-        mm_monthly_fig = figure_instance.create_monthly_mm_graph(money_moved_ytd_df, "money_moved_cumulative", fund_raise_target)
+        return figure_instance.create_monthly_mm_graph(money_moved_ytd_df, "cf_money_moved_cumulative", CF_FUND_RAISE_TARGET)
+
+    return figure_instance.create_monthly_mm_graph(money_moved_ytd_df, "money_moved_cumulative", FUND_RAISE_TARGET)
 
-    # mm_mosaic_fig = figure_instance.create_money_mural_mosaic(money_moved_ytd_df)
 
+@figure_cache.memoize("recurring-money-moved-bar-graph", merged_version)
+def build_reoccuring_vs_onetime_graph(selected_fy):
     # Recurring vs One-Time bar graph
-    money_moved_reoccuring_df = (money_moved_lf
-            .group_by(["payment_date_fm", "payment_date_calendar_month", "payment_date_calendar_monthyear", "pledge_frequency_type"])
-            .agg([
-                pl.col("payment_amount_usd").sum().alias("money_moved_usd"),
-            ])
-            .sort(["payment_date_fm", "pledge_frequency_type"])
-            # .with_columns([
-            #     pl.sum("money_moved_usd").over(["payment_date_fm"]).alias("money_moved_monthly"),
-            # ])
-            # .with_columns([
-            #     pl.col("money_moved_monthly").cum_sum().over(["pledge_frequency_type"]).alias("money_moved_usd_cumulative"),
-            # ])
-            .collect()  
-        )
-            
-    reoccuring_vs_onetime_fig = figure_instance.create_reoccuring_vs_onetime_bar_graph(money_moved_reoccuring_df)
-    # End of recurring vs one-time bar graph
+    money_moved_reoccuring_df = get_money_moved_fy_data(selected_fy)["reoccuring"]
+
+    return figure_instance.create_reoccuring_vs_onetime_bar_graph(money_moved_reoccuring_df)
 
+
+@figure_cache.memoize("chapter-dumbell-graph", merged_version)
+def build_chapter_dumbell_graph(selected_fy, topn_donor_chapter_value):
     # Top N Donor Chapter Dumbell Chart (Selected FY vs Prior FY)
-    prior_fy_value = f"FY{int(selected_fy[2:6]) - 1}-{int(selected_fy[7:]) - 1}"
-    
-    # New section 
-    dumbell_chart_fig = create_dumbell_chart_with_logos(
+    return create_dumbell_chart_with_logos(
         data_preparer=data_preparer,
         selected_fy=selected_fy,
-        prior_fy_value=prior_fy_value,
+        prior_fy_value=get_prior_fy(selected_fy),
         top_n=topn_donor_chapter_value,
         logo_mapping=logo_mapping  # optional, or add inside the helper later
     )
 
-    #End of Top N Donor Chapter Dumbell Chart
 
+@figure_cache.memoize("money-moved-heatmap-graph", merged_version)
+def build_mm_heatmap_graph(selected_fy):
     # Calendar heatmap
-    mm_heatmap_fig = figure_instance.create_calendarplot(money_moved_lf.collect())
-    # End of calendar heatmap
-
-    # For AI insight
-    ai_insight = []
-    if chart_insight:
-        if chart_insight == "money-moved-cumulative-graph":
-            ai_insight.append(data_preparer.get_llm_insight(mm_monthly_fig.to_json()))
-        # elif chart_insight == "cf-money-moved-cumulative-graph":
-        #     ai_insight.append(data_preparer.get_llm_insight(mm_monthly_fig.to_json()))
-        elif chart_insight == "money-moved-heatmap-graph":
-            ai_insight.append(data_preparer.get_llm_insight(mm_heatmap_fig.to_json()))
-        elif chart_insight == "recurring-money-moved-bar-graph":
-            ai_insight.append(data_preparer.get_llm_insight(reoccuring_vs_onetime_fig.to_json()))
-        elif chart_insight == "chapter-dumbell-graph":
-            ai_insight.append(data_preparer.get_llm_insight(dumbell_chart_fig.to_json()))
-        # else:
-        #     ai_insight.append("No insight available for this chart.")
-
-    new_ai_messages = ai_insight + existing_ai_messages if len(ai_insight) > 0 else existing_ai_messages
-
-    return mm_card, cf_mm_card, mm_monthly_fig, reoccuring_vs_onetime_fig, dumbell_chart_fig, mm_heatmap_fig, new_ai_messages
+    return figure_instance.create_calendarplot(get_mm_daily_data(selected_fy))
+
+
+@figure_cache.memoize("money-moved-line-graph", merged_version)
+def build_mm_monthly_trendline(selected_fy, selected_amount_type, selected_drilldown_by):
+    # Both amount types are drawn from the same cached monthly aggregate of the rollup cube
+    monthly_df = get_mm_monthly_data(selected_fy, selected_drilldown_by)
+
+    return figure_instance.create_mm_monthly_trendline(monthly_df.lazy(), selected_amount_type, selected_drilldown_by)
+
+
+@figure_cache.memoize("active-pledge-arr-sankey-graph", pledge_active_arr_version)
+def build_active_pledge_arr_sankey(selected_fy, selected_view_mode):
+    return figure_instance.create_active_pledge_arr_sankey(get_pledge_active_arr_data(selected_fy), selected_view_mode)
 
 
 @callback(
-    Output("money-moved-line-graph", "figure"),
-    Output("ai-message-store", "data", allow_duplicate = True),
+    Output("money-moved-card", "children"),
+    Output("cf-money-moved-card", "children"),
+    Input("fy-filter", "value"),
+    prevent_initial_call = False
+)
+@timed("callback")
+def update_money_moved_cards(selected_fy):
+    money_moved_kpis_df = get_money_moved_fy_data(selected_fy)["kpis"]
+
+    # mm FYTD
+    money_moved_ytd_value = money_moved_kpis_df["payment_amount_usd"].item()
+    mm_card = figure_instance.create_kpi_card(money_moved_ytd_value, goal = FUND_RAISE_TARGET, body_text = "Money Moved FYTD")
+
+    # cf mm FYTD
+    cf_money_moved_ytd_value = money_moved_kpis_df["payment_cf_amount_usd"].item()
+    cf_mm_card = figure_instance.create_kpi_card(cf_money_moved_ytd_value, goal = CF_FUND_RAISE_TARGET, body_text = "CF Money Moved FYTD")
+
+    return mm_card, cf_mm_card
+
+
+@callback(
+    Output("money-moved-cumulative-figures", "data"),
+    Input("fy-filter", "value"),
+    prevent_initial_call = False
+)
+@timed("callback")
+def update_mm_cumulative_graph(selected_fy):
+    # Both amount types are sent at once, the shared figure with the data of each type, so toggling the amount type
+    # radio never calls the server
+    return figure_instance.create_figure_variants({amount_type: build_mm_cumulative_graph(selected_fy, amount_type) for amount_type in AMOUNT_TYPES})
+
+
+clientside_callback(
+    ClientsideFunction(namespace = "money_moved", function_name = "select_amount_type_figure"),
+    Output("money-moved-cumulative-graph", "figure"),
+    Input("money-moved-cumulative-figures", "data"),
+    Input("mm-cf-cumulative-radio-filter", "value"),
+)
+
+
+@callback(
+    Output("recurring-money-moved-bar-graph", "figure"),
+    Input("fy-filter", "value"),
+    prevent_initial_call = False
+)
+@timed("callback")
+def update_reoccuring_vs_onetime_graph(selected_fy):
+    return build_reoccuring_vs_onetime_graph(selected_fy)
+
+
+@callback(
+    Output("chapter-dumbell-graph", "figure"),
+    Input("fy-filter", "value"),
+    Input("topn-chapter-slider", "value"),
+    prevent_initial_call = False
+)
+@timed("callback")
+def update_chapter_dumbell_graph(selected_fy, topn_donor_chapter_value):
+    return build_chapter_dumbell_graph(selected_fy, topn_donor_chapter_value)
+
+
+@callback(
+    Output("money-moved-heatmap-graph", "figure"),
+    Input("fy-filter", "value"),
+    prevent_initial_call = False
+)
+@timed("callback")
+def update_mm_heatmap_graph(selected_fy):
+    return build_mm_heatmap_graph(selected_fy)
+
+
+@callback(
+    Output("money-moved-line-figures", "data"),
     Input("fy-filter", "value"),
-    Input("mm-cf-radio-filter", "value"),
     Input("line-drilldown-by-filter", "value"),
-    Input({"type": "ai-icon", "chart": ALL}, "n_clicks"),
-    State("ai-message-store", "data"),
-    prevent_initial_call = "initial_duplicate"
+    prevent_initial_call = False
 )
-def update_mm_monthly_trendline(selected_fy, selected_amount_type, selected_drilldown_by, ai_icon_clicks_list, existing_ai_messages):
-    triggered_id = ctx.triggered_id
-    chart_insight = None
+@timed("callback")
+def update_mm_monthly_trendline(selected_fy, selected_drilldown_by):
+    return figure_instance.create_figure_variants({
+        amount_type: build_mm_monthly_trendline(selected_fy, amount_type, selected_drilldown_by) for amount_type in AMOUNT_TYPES
+    })
 
-    # Check if the triggered_id is a dictionary and has a "type" key
-    # This is to check if the triggered_id is from the ai-icon
-    if triggered_id and isinstance(triggered_id, dict) and "type" in triggered_id:
-        chart_insight = triggered_id.get("chart")
 
-    filters = []
+clientside_callback(
+    ClientsideFunction(namespace = "money_moved", function_name = "select_amount_type_figure"),
+    Output("money-moved-line-graph", "figure"),
+    Input("money-moved-line-figures", "data"),
+    Input("mm-cf-radio-filter", "value"),
+)
 
-    if selected_fy:
-        filters.append(("payment_date_fy", "==", selected_fy))
-
-    merged_lf = data_preparer.filter_data("merged", filters)
-
-    money_moved_lf = (merged_lf
-                        .select(["payment_date_fy", "payment_date_fm", "payment_date_calendar_year", "payment_date_calendar_month", "payment_date_calendar_monthname", 
-                            "payment_date_calendar_monthyear", "payment_date_day_of_week", "payment_date_week_of_fy", "pledge_status", "pledge_chapter_type", 
-                            "payment_portfolio", "payment_platform", "payment_date", "payment_amount_usd", "payment_cf_amount_usd"
-                        ])                   
-                        .filter(~pl.col("payment_portfolio").is_in(["One for the World Discretionary Fund", "One for the World Operating Costs"]))
-                    .sort("payment_date_fm")
-                    )
-    
-    mm_monthly_trendline_fig = figure_instance.create_mm_monthly_trendline(money_moved_lf, selected_amount_type, selected_drilldown_by)      
-    
-    # For AI insight
-    ai_insight = []
-    if chart_insight:
-        if chart_insight =="money-moved-line-graph":
-            ai_insight.append(data_preparer.get_llm_insight(mm_monthly_trendline_fig.to_json()))
-        # else:
-        #     ai_insight.append("No insight available for this chart.")
-
-    new_ai_messages = ai_insight + existing_ai_messages if len(ai_insight) > 0 else existing_ai_messages
-
-    return mm_monthly_trendline_fig , new_ai_messages
 
 @callback(
     Output("active-pledge-arr-sankey-graph", "figure"),
     Output("active-pledge-arr-card", "children"),
-    Output("ai-message-store", "data", allow_duplicate = True),
     Input("fy-filter", "value"),
     Input("active-pledge-arr-sankey-view-mode", "value"),
-    Input({"type": "ai-icon", "chart": ALL}, "n_clicks"),
-    State("ai-message-store", "data"),
-    prevent_initial_call = "initial_duplicate"
+    prevent_initial_call = False
 )
-def update_active_pledge_arr_sankey(selected_fy, selected_view_mode, ai_icon_clicks_list, existing_ai_messages):
-    triggered_id = ctx.triggered_id
-    chart_insight = None
+@timed("callback")
+def update_active_pledge_arr_sankey(selected_fy, selected_view_mode):
+    pledge_active_arr_df = get_pledge_active_arr_data(selected_fy)
 
-    # Check if the triggered_id is a dictionary and has a "type" key
-    # This is to check if the triggered_id is from the ai-icon
-    if triggered_id and isinstance(triggered_id, dict) and "type" in triggered_id:
-        chart_insight = triggered_id.get("chart")
+    total_arr_value = pledge_active_arr_df.select(pl.sum("pledge_contribution_arr_usd")).item()
+    active_pledge_arr_card = figure_instance.create_kpi_card(total_arr_value, goal = 1_200_000, body_text = "Active Annualized Run Rate")
 
-    filters = []
+    return build_active_pledge_arr_sankey(selected_fy, selected_view_mode), active_pledge_arr_card
+
+
+def register_prewarm_tasks():
+    """
+    Registers the warm-up of every chart of every FY with the default control values of the layout (see utils.prewarm),
+    the most recent FY first.
+    """
+    for selected_fy in data_preparer.get_col_unique_values("merged", "payment_date_fy", sort_desc = True):
+        prewarmer.register(f"{selected_fy} money-moved-cards", get_money_moved_fy_data, selected_fy)
+        prewarmer.register(f"{selected_fy} money-moved-cumulative-graph", update_mm_cumulative_graph, selected_fy)
+        prewarmer.register(f"{selected_fy} recurring-money-moved-bar-graph", build_reoccuring_vs_onetime_graph, selected_fy)
+        prewarmer.register(f"{selected_fy} chapter-dumbell-graph", build_chapter_dumbell_graph, selected_fy, 10)
+        prewarmer.register(f"{selected_fy} money-moved-heatmap-graph", build_mm_heatmap_graph, selected_fy)
+        prewarmer.register(f"{selected_fy} money-moved-line-graph", update_mm_monthly_trendline, selected_fy, "")
+        prewarmer.register(f"{selected_fy} active-pledge-arr-sankey-graph", build_active_pledge_arr_sankey, selected_fy, "actual")
+
+
+register_prewarm_tasks()
+
+
+# Insight data of each chart: its source aggregates as a few compact tables and notes, built from the cached page queries.
+# The LLM gets them as a digest instead of the figure JSON (which carries the template, the layout and the base64 logos),
+# and the local insight engine computes its statistics on the same tables.
+
+def get_mm_cumulative_graph_insight_data(selected_fy, selected_amount_type):
+    money_moved_ytd_df = get_money_moved_fy_data(selected_fy)["monthly"]
+    prefix = "cf_" if "cf" in selected_amount_type else ""
+
+    return dict(
+        title = "Cumulative Money Moved" if not prefix else "Cumulative Counterfactual Money Moved",
+        tables = {"monthly": money_moved_ytd_df.select([
+            pl.col("payment_date_calendar_monthyear").alias("month"),
+            pl.col(f"{prefix}money_moved_monthly").alias("money_moved"),
+            pl.col(f"{prefix}money_moved_cumulative").alias("cumulative"),
+        ])},
+        notes = {
+            "FY": selected_fy,
+            "FY target": CF_FUND_RAISE_TARGET if prefix else FUND_RAISE_TARGET,
+        },
+    )
 
-    if selected_fy:
-        filters.append(("pledge_starts_at_fy", "==", selected_fy))
 
-    pledge_active_arr_df = data_preparer.filter_data("pledge_active_arr", filters).collect()
+def get_reoccuring_vs_onetime_graph_insight_data(selected_fy):
+    money_moved_reoccuring_df = get_money_moved_fy_data(selected_fy)["reoccuring"]
+
+    return dict(
+        title = "Reoccuring vs. One-Time Money Moved by month",
+        tables = {"monthly": money_moved_reoccuring_df
+            .pivot(on = "pledge_frequency_type", index = ["payment_date_fm", "payment_date_calendar_monthyear"], values = "money_moved_usd")
+            .sort("payment_date_fm")
+            .drop("payment_date_fm")
+            .rename({"payment_date_calendar_monthyear": "month"})
+        },
+        notes = {"FY": selected_fy},
+    )
 
 
-    total_arr_value = pledge_active_arr_df.select(pl.sum("pledge_contribution_arr_usd")).item()
-    active_pledge_arr_card = figure_instance.create_kpi_card(total_arr_value, goal = 1_200_000, body_text = "Active Annualized Run Rate")
+def get_chapter_dumbell_graph_insight_data(selected_fy, topn_donor_chapter_value):
+    prior_fy_value = get_prior_fy(selected_fy)
+    df_top = get_dumbell_chart_data(data_preparer, selected_fy, prior_fy_value, topn_donor_chapter_value)
+
+    return dict(
+        title = f"Top {topn_donor_chapter_value} Donor Chapters - {selected_fy} vs {prior_fy_value}",
+        tables = {"chapters": df_top.select([
+            pl.col("pledge_donor_chapter").alias("chapter"),
+            pl.col("selected_fy").alias(selected_fy),
+            pl.col("prior_fy").alias(prior_fy_value),
+            (pl.col("selected_fy") - pl.col("prior_fy")).alias("change"),
+        ])},
+        notes = {"FY": selected_fy, "Prior FY": prior_fy_value, "Unit": "USD money moved"},
+    )
+
+
+def get_mm_heatmap_graph_insight_data(selected_fy):
+    money_moved_daily_df = get_mm_daily_data(selected_fy)
+    weekdays = {1: "Mon", 2: "Tue", 3: "Wed", 4: "Thu", 5: "Fri", 6: "Sat", 7: "Sun"}
+
+    return dict(
+        title = "Money Moved by day of the week (calendar heatmap)",
+        tables = {
+            "by_weekday": money_moved_daily_df
+                .group_by("payment_date_day_of_week")
+                .agg(pl.col("payment_amount_usd").sum().alias("money_moved"))
+                .sort("payment_date_day_of_week")
+                .select([
+                    pl.col("payment_date_day_of_week").replace_strict(weekdays, return_dtype = pl.String).alias("weekday"),
+                    "money_moved",
+                ]),
+            "by_month": money_moved_daily_df
+                .group_by(["payment_date_fm", "payment_date_calendar_monthname"])
+                .agg([
+                    pl.col("payment_amount_usd").sum().alias("money_moved"),
+                    pl.col("payment_date").n_unique().alias("days_with_payments"),
+                ])
+                .sort("payment_date_fm")
+                .drop("payment_date_fm")
+                .rename({"payment_date_calendar_monthname": "month"}),
+            "top_days": money_moved_daily_df
+                .group_by("payment_date")
+                .agg(pl.col("payment_amount_usd").sum().alias("money_moved"))
+                .sort("money_moved", descending = True)
+                .head(10),
+        },
+        notes = {"FY": selected_fy},
+    )
+
+
+def get_mm_monthly_trendline_insight_data(selected_fy, selected_amount_type, selected_drilldown_by):
+    monthly_df = get_mm_monthly_data(selected_fy, selected_drilldown_by).rename({selected_amount_type: "money_moved"})
+    notes = {
+        "FY": selected_fy,
+        "Amount": "counterfactual money moved" if "cf" in selected_amount_type else "money moved",
+        "Drilldown by": selected_drilldown_by or "none",
+    }
+
+    # Without any month there is nothing to pivot
+    if monthly_df.is_empty():
+        notes["Data"] = "no money moved in this FY"
+        return dict(
+            title = "Monthly Donation Trends",
+            tables = {"monthly": pl.DataFrame(schema = {selected_drilldown_by or "month": pl.String, "total" if selected_drilldown_by else "money_moved": pl.Float64})},
+            notes = notes,
+        )
+
+    if selected_drilldown_by:
+        # One row per drilldown value (largest first) and one column per month
+        monthly_df = (monthly_df
+            .with_columns(pl.col(selected_drilldown_by).cast(pl.String).fill_null("Unknown"))
+            .pivot(on = "payment_date_calendar_monthyear", index = selected_drilldown_by, values = "money_moved", aggregate_function = "sum")
+            .fill_null(0)
+        )
+        monthly_df = (monthly_df
+            .with_columns(pl.sum_horizontal(pl.exclude(selected_drilldown_by)).alias("total"))
+            .sort("total", descending = True)
+        )
+    else:
+        monthly_df = monthly_df.select([pl.col("payment_date_calendar_monthyear").alias("month"), "money_moved"])
+
+    return dict(
+        title = "Monthly Donation Trends",
+        tables = {"monthly": monthly_df},
+        notes = notes,
+    )
+
+
+def get_active_pledge_arr_sankey_insight_data(selected_fy, selected_view_mode):
+    pledge_active_arr_df = get_pledge_active_arr_data(selected_fy)
+
+    notes = {
+        "Pledge start FY": selected_fy,
+        "Total active ARR": pledge_active_arr_df["pledge_contribution_arr_usd"].sum(),
+    }
+    if selected_view_mode == "target":
+        notes["ARR target"] = 1_000_000
+
+    return dict(
+        title = "Active Pledge ARR (Annualized Run Rate) flow from chapter type to pledge frequency",
+        tables = {"arr": pledge_active_arr_df
+            .group_by(["pledge_chapter_type", "pledge_frequency"])
+            .agg([
+                pl.col("pledge_contribution_arr_usd").sum().alias("arr"),
+                pl.col("pledge_count").sum().alias("pledges"),
+            ])
+            .sort("arr", descending = True)
+        },
+        notes = notes,
+    )
+
 
-    # Sankey graph
-    active_pledge_arr_sankey_fig = figure_instance.create_active_pledge_arr_sankey(pledge_active_arr_df, selected_view_mode)
+def get_chart_insight_data(chart_id, controls):
+    """
+    Returns the insight data (title, tables, notes) of the data the chart currently shows.
 
-    # For AI insight
-    ai_insight = []
-    if chart_insight:
-        if chart_insight =="active-pledge-arr-sankey-graph":
-            ai_insight.append(data_preparer.get_llm_insight(active_pledge_arr_sankey_fig.to_json()))
-        # else:
-        #     ai_insight.append("No insight available for this chart.")
+    Parameters:
+    - chart_id (str): Chart id of the clicked AI icon.
+    - controls (dict): Current values of the page controls, keyed by control id.
 
-    new_ai_messages = ai_insight + existing_ai_messages if len(ai_insight) > 0 else existing_ai_messages
+    Returns:
+    - dict or None: None for an unknown chart id.
+    """
+    selected_fy = controls["fy-filter"]
 
-    return active_pledge_arr_sankey_fig, active_pledge_arr_card, new_ai_messages
+    chart_insight_data = {
+        "money-moved-cumulative-graph": lambda: get_mm_cumulative_graph_insight_data(selected_fy, controls["mm-cf-cumulative-radio-filter"]),
+        "recurring-money-moved-bar-graph": lambda: get_reoccuring_vs_onetime_graph_insight_data(selected_fy),
+        "chapter-dumbell-graph": lambda: get_chapter_dumbell_graph_insight_data(selected_fy, controls["topn-chapter-slider"]),
+        "money-moved-heatmap-graph": lambda: get_mm_heatmap_graph_insight_data(selected_fy),
+        "money-moved-line-graph": lambda: get_mm_monthly_trendline_insight_data(selected_fy, controls["mm-cf-radio-filter"], controls["line-drilldown-by-filter"]),
+        "active-pledge-arr-sankey-graph": lambda: get_active_pledge_arr_sankey_insight_data(selected_fy, controls["active-pledge-arr-sankey-view-mode"]),
+    }
 
+    if chart_id not in chart_insight_data:
+        return None
+
+    return chart_insight_data[chart_id]()
+
+
+# Local (statistical) insight of each chart, computed on its insight data
+local_chart_insights = {
+    "money-moved-cumulative-graph": lambda data: insight_engine.cumulative_insight(data["tables"]["monthly"], data["notes"]["FY target"]),
+    "recurring-money-moved-bar-graph": lambda data: insight_engine.reoccuring_insight(data["tables"]["monthly"]),
+    "chapter-dumbell-graph": lambda data: insight_engine.chapter_insight(data["tables"]["chapters"], data["notes"]["FY"], data["notes"]["Prior FY"]),
+    "money-moved-heatmap-graph": lambda data: insight_engine.heatmap_insight(data["tables"]["by_weekday"], data["tables"]["by_month"], data["tables"]["top_days"]),
+    "money-moved-line-graph": lambda data: insight_engine.trendline_insight(data["tables"]["monthly"], data["notes"]["Drilldown by"] if data["notes"]["Drilldown by"] != "none" else None),
+    "active-pledge-arr-sankey-graph": lambda data: insight_engine.sankey_insight(data["tables"]["arr"], data["notes"].get("ARR target")),
+}
+
+
+def generate_chart_insight(chart_id, insight_data, on_partial = None):
+    """
+    Returns the insight markdown of a chart. Runs as a background job.
+
+    The local insight is returned directly with INSIGHT_ENGINE=local, otherwise it is the fallback when the LLM fails.
+    """
+    local_insight = local_chart_insights[chart_id](insight_data)
+    if INSIGHT_ENGINE == "local":
+        return local_insight
+
+    return data_preparer.get_llm_insight(chart_digest(**insight_data), on_partial = on_partial, fallback_insight = local_insight)
+
+
+# The pending job list is only changed with Patch operations (append on click, remove when finished), so a click and
+# a poll running at the same time cannot overwrite each other's changes with a stale copy of the list.
 @callback(
-    Output("ai-output", "children"),
-    Input("ai-message-store", "data")
+    Output("ai-job-store", "data"),
+    Output("ai-loading", "display"),
+    Input({"type": "ai-icon", "chart": ALL}, "n_clicks"),
+    State("fy-filter", "value"),
+    State("mm-cf-cumulative-radio-filter", "value"),
+    State("topn-chapter-slider", "value"),
+    State("mm-cf-radio-filter", "value"),
+    State("line-drilldown-by-filter", "value"),
+    State("active-pledge-arr-sankey-view-mode", "value"),
+    prevent_initial_call = True
 )
-def render_ai_output(messages):
+@timed("callback")
+def update_ai_insight(ai_icon_clicks_list, selected_fy, selected_cumulative_amount_type, topn_donor_chapter_value,
+                      selected_trendline_amount_type, selected_drilldown_by, selected_view_mode):
+    triggered_id = ctx.triggered_id
+
+    # Check if the triggered_id is from an ai-icon which was actually clicked
+    if not (isinstance(triggered_id, dict) and triggered_id.get("type") == "ai-icon") or not any(ai_icon_clicks_list):
+        return dash.no_update, dash.no_update
+
+    chart_id = triggered_id.get("chart")
+    insight_data = get_chart_insight_data(chart_id, {
+        "fy-filter": selected_fy,
+        "mm-cf-cumulative-radio-filter": selected_cumulative_amount_type,
+        "topn-chapter-slider": topn_donor_chapter_value,
+        "mm-cf-radio-filter": selected_trendline_amount_type,
+        "line-drilldown-by-filter": selected_drilldown_by,
+        "active-pledge-arr-sankey-view-mode": selected_view_mode,
+    })
+    if insight_data is None:
+        return dash.no_update, dash.no_update
+
+    # The insight is generated in the background, the poll below picks it up when it is ready
+    job_id = insight_jobs.submit(chart_id, generate_chart_insight, chart_id, insight_data, stream = LLM_STREAM and INSIGHT_ENGINE != "local")
+
+    pending_job_ids = Patch()
+    pending_job_ids.append(job_id)
+
+    return pending_job_ids, "show"
+
+
+clientside_callback(
+    ClientsideFunction(namespace = "money_moved", function_name = "poll_while_pending"),
+    Output("ai-job-poll", "disabled"),
+    Input("ai-job-store", "data"),
+)
+
+
+@callback(
+    Output("ai-message-store", "data"),
+    Output("ai-job-store", "data", allow_duplicate = True),
+    Output("ai-loading", "display", allow_duplicate = True),
+    Output("ai-stream-output", "children"),
+    Input("ai-job-poll", "n_intervals"),
+    State("ai-job-store", "data"),
+    State("ai-session-id", "data"),
+    prevent_initial_call = True
+)
+@timed("callback")
+def poll_ai_insight_jobs(n_intervals, pending_job_ids, session_id):
+    finished_insights = []
+    streaming_insights = []
+    removed_job_ids = []
+    still_pending = False
+    redelivered = False
+
+    for job_id in pending_job_ids or []:
+        job = insight_jobs.get(job_id)
+        if job is None:
+            removed_job_ids.append(job_id)
+        elif job["status"] in (JOB_DONE, JOB_ERROR):
+            removed_job_ids.append(job_id)
+            # A poll whose response was dropped by the browser already stored the insight
+            if job.get("delivered"):
+                redelivered = True
+            else:
+                finished_insights.append(job["markdown"])
+                insight_jobs.update(job_id, delivered = True)
+        else:
+            still_pending = True
+            if job["markdown"]:
+                streaming_insights.append(job["markdown"])
+
+    # The spinner is shown until the first text of a pending insight arrives
+    loading_display = "show" if still_pending and not streaming_insights else "auto"
+
+    if not removed_job_ids:
+        if not streaming_insights:
+            return dash.no_update, dash.no_update, loading_display, dash.no_update
+        return dash.no_update, dash.no_update, loading_display, render_ai_messages(streaming_insights[::-1])
+
+    # Newest insight first, the client only gets the new version of the session's insights
+    if finished_insights:
+        ai_messages_version = insight_messages.prepend(session_id, finished_insights[::-1])
+    elif redelivered:
+        ai_messages_version = insight_messages.get(session_id)[0]
+    else:
+        ai_messages_version = dash.no_update
+
+    # Only the finished jobs are removed, jobs submitted while this poll ran stay in the list
+    job_id_patch = Patch()
+    for job_id in removed_job_ids:
+        job_id_patch.remove(job_id)
+
+    return ai_messages_version, job_id_patch, loading_display, render_ai_messages(streaming_insights[::-1])
+
+
+def render_ai_messages(messages):
     return [
         html.Div([
             dcc.Markdown(msg),
             html.Hr(style={"margin": "10px 0"})  # ← clean separator
         ]) for msg in messages
-    ]
\ No newline at end of file
+    ]
+
+
+# Also rendered when the stored session id of the tab is restored, e.g. when navigating back to the page
+@callback(
+    Output("ai-output", "children"),
+    Input("ai-message-store", "data"),
+    Input("ai-session-id", "data"),
+)
+@timed("callback")
+def render_ai_output(ai_messages_version, session_id):
+    _, messages = insight_messages.get(session_id)
+
+    return render_ai_messages(messages)
\ No newline at end of file
@@ -0,0 +1,30 @@
+import csv
+import io
+
+import polars as pl
+
+from utils.insight_digest import CHARS_PER_TOKEN, chart_digest
+
+
+def test_names_with_commas_and_quotes_are_quoted():
+    names = ["Smith, Jones & Co", 'The "Best" chapter', "Plain"]
+    digest = chart_digest("Chapters", {"chapters": pl.DataFrame({"chapter": names, "total": [1500.0, 200.0, 0.5]})})
+
+    table_lines = digest.split("\n")[2:]
+    rows = list(csv.reader(io.StringIO("\n".join(table_lines))))
+
+    assert rows == [["chapter", "total"], ["Smith, Jones & Co", "1500"], ['The "Best" chapter', "200"], ["Plain", "0.50"]]
+
+
+def test_rows_are_dropped_from_the_longest_table_to_fit_the_budget():
+    tables = {
+        "long": pl.DataFrame({"month": [f"month {i}" for i in range(100)], "amount": [float(i) for i in range(100)]}),
+        "short": pl.DataFrame({"type": ["recurring", "one-time"], "amount": [1.0, 2.0]}),
+    }
+
+    digest = chart_digest("Money Moved", tables, {"FY": "FY2024-2025"}, token_budget = 60)
+
+    assert len(digest) <= 60 * CHARS_PER_TOKEN
+    assert "month 0,0" in digest
+    assert "more rows" in digest.split("Table short:")[0]
+    assert digest.endswith("Table short:\ntype,amount\nrecurring,1\none-time,2")
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from utils.insight_jobs import InsightJobStore, JOB_DONE, JOB_ERROR, JOB_ERROR_MESSAGE, JOB_PENDING, JOB_RUNNING
+
+
+@pytest.fixture
+def job_store(tmp_path):
+    return InsightJobStore(job_dir = tmp_path, max_workers = 2, partial_interval = 0)
+
+
+def wait_for_job(job_store, job_id, timeout = 5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = job_store.get(job_id)
+        if job["status"] in (JOB_DONE, JOB_ERROR):
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(f"Job {job_id} did not finish")
+
+
+def test_job_runs_in_the_background(job_store):
+    release = threading.Event()
+
+    def insight(chart_id):
+        release.wait(5)
+        return f"insight of {chart_id}"
+
+    job_id = job_store.submit("chart", insight, "chart")
+
+    assert job_store.get(job_id)["status"] in (JOB_PENDING, JOB_RUNNING)
+    release.set()
+
+    job = wait_for_job(job_store, job_id)
+    assert job["status"] == JOB_DONE
+    assert job["chart_id"] == "chart"
+    assert job["markdown"] == "insight of chart"
+
+
+def test_streaming_job_publishes_partial_markdown(job_store):
+    published = threading.Event()
+    release = threading.Event()
+
+    def insight(on_partial = None):
+        on_partial("partial")
+        published.set()
+        release.wait(5)
+        return "partial and the rest"
+
+    job_id = job_store.submit("chart", insight, stream = True)
+
+    assert published.wait(5)
+    running_job = job_store.get(job_id)
+    release.set()
+
+    assert running_job["status"] == JOB_RUNNING
+    assert running_job["markdown"] == "partial"
+    assert wait_for_job(job_store, job_id)["markdown"] == "partial and the rest"
+
+
+def test_failing_job_reports_the_error_message(job_store):
+    def insight():
+        raise RuntimeError("no insight")
+
+    job = wait_for_job(job_store, job_store.submit("chart", insight))
+
+    assert job["status"] == JOB_ERROR
+    assert job["markdown"] == JOB_ERROR_MESSAGE
+
+
+def test_unfinished_job_times_out(job_store):
+    job_store.job_timeout = 0
+    release = threading.Event()
+
+    job_id = job_store.submit("chart", release.wait, 5)
+    time.sleep(0.01)
+    job = job_store.get(job_id)
+    release.set()
+
+    assert job["status"] == JOB_ERROR
+    assert job["markdown"] == JOB_ERROR_MESSAGE
+
+
+@pytest.mark.parametrize("job_id", ["../outside", "ABCDEF" * 6, "0" * 31, None, ["0" * 32]])
+def test_invalid_job_id_is_unknown(job_store, job_id):
+    assert job_store.get(job_id) is None
+
+
+@pytest.mark.parametrize("content", ["not json", "[]", json.dumps({"status": JOB_DONE})])
+def test_malformed_job_file_is_unknown(job_store, content):
+    job_id = "0" * 32
+    (job_store.job_dir / f"{job_id}.json").write_text(content)
+
+    assert job_store.get(job_id) is None
+
+
+def test_expired_job_files_are_deleted(job_store):
+    job_id = job_store.submit("chart", str, "insight")
+    wait_for_job(job_store, job_id)
+
+    expired = time.time() - job_store.job_ttl - 1
+    os.utime(job_store.job_dir / f"{job_id}.json", (expired, expired))
+    job_store.submit("chart", str, "insight")
+
+    assert job_store.get(job_id) is None
@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+
+from utils.insight_messages import InsightMessageStore
+
+
+@pytest.fixture
+def message_store(tmp_path):
+    return InsightMessageStore(store_dir = tmp_path, max_messages = 3)
+
+
+def test_messages_are_kept_newest_first_with_a_version(message_store):
+    session_id = message_store.new_session_id()
+
+    assert message_store.get(session_id) == (0, [])
+    assert message_store.prepend(session_id, ["first"]) == 1
+    assert message_store.prepend(session_id, ["third", "second"]) == 2
+    assert message_store.get(session_id) == (2, ["third", "second", "first"])
+
+
+def test_ring_buffer_drops_the_oldest_messages(message_store):
+    session_id = message_store.new_session_id()
+
+    for i in range(5):
+        message_store.prepend(session_id, [f"insight {i}"])
+
+    assert message_store.get(session_id) == (5, ["insight 4", "insight 3", "insight 2"])
+
+    # More new messages than fit keep the newest ones
+    message_store.prepend(session_id, ["insight 8", "insight 7", "insight 6", "insight 5"])
+    assert message_store.get(session_id) == (6, ["insight 8", "insight 7", "insight 6"])
+
+
+def test_sessions_are_separate(message_store):
+    session_id, other_session_id = message_store.new_session_id(), message_store.new_session_id()
+
+    message_store.prepend(session_id, ["insight"])
+
+    assert message_store.get(other_session_id) == (0, [])
+
+
+@pytest.mark.parametrize("session_id", ["../outside", "", None])
+def test_invalid_session_id_is_not_stored(message_store, session_id):
+    assert message_store.prepend(session_id, ["insight"]) == 0
+    assert message_store.get(session_id) == (0, [])
+    assert list(message_store.store_dir.iterdir()) == []
+
+
+def test_expired_sessions_are_deleted(message_store):
+    session_id, other_session_id = message_store.new_session_id(), message_store.new_session_id()
+    message_store.prepend(session_id, ["insight"])
+
+    expired = time.time() - message_store.session_ttl - 1
+    os.utime(message_store.store_dir / f"{session_id}.json", (expired, expired))
+    message_store.prepend(other_session_id, ["insight"])
+
+    assert message_store.get(session_id) == (0, [])
+    assert not (message_store.store_dir / f"{session_id}.lock").exists()
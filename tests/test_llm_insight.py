@@ -0,0 +1,65 @@
+import openai
+import pytest
+
+import utils.data_preparer as data_preparer_module
+from utils.data_preparer import DataPreparer
+from utils.fake_llm_server import start_in_background
+from utils.insight_cache import InsightCache
+
+CHART_DATA = "Chart: Money Moved\nmonth,money_moved\nJul,100.0\nAug,200.0"
+
+
+@pytest.fixture
+def insight_cache(tmp_path, monkeypatch):
+    cache = InsightCache(cache_dir = tmp_path / "insights")
+    monkeypatch.setattr(data_preparer_module, "insight_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    server, base_url = start_in_background()
+    # The module level client joins the request paths onto base_url as it is, without adding the trailing slash
+    monkeypatch.setattr(openai, "base_url", f"{base_url}/")
+    monkeypatch.setattr(openai, "api_key", "fake")
+    monkeypatch.setattr(openai, "max_retries", 0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_streamed_insight_is_reported_in_parts_and_cached(fake_llm, insight_cache):
+    data_preparer = DataPreparer()
+    partials = []
+
+    insight = data_preparer.get_llm_insight(CHART_DATA, on_partial = partials.append)
+
+    assert insight.startswith("1. Summary: Fake insight")
+    assert len(partials) > 1
+    assert all(later.startswith(earlier) for earlier, later in zip(partials, partials[1:]))
+    assert partials[-1] == insight
+    assert insight_cache.get(data_preparer._insight_cache_key(CHART_DATA)) == insight
+
+
+def test_cached_insight_is_served_without_a_request(fake_llm, insight_cache):
+    data_preparer = DataPreparer()
+    insight = data_preparer.get_llm_insight(CHART_DATA)
+
+    fake_llm.shutdown()
+    fake_llm.server_close()
+
+    assert data_preparer.get_llm_insight(CHART_DATA, fallback_insight = "fallback") == insight
+
+
+def test_fallback_is_returned_and_not_cached_on_error(fake_llm, insight_cache):
+    # Requests to the stopped server are refused
+    fake_llm.shutdown()
+    fake_llm.server_close()
+    data_preparer = DataPreparer()
+    partials = []
+
+    insight = data_preparer.get_llm_insight(CHART_DATA, on_partial = partials.append, fallback_insight = "fallback")
+
+    assert insight == "fallback"
+    assert partials == []
+    assert insight_cache.get(data_preparer._insight_cache_key(CHART_DATA)) is None
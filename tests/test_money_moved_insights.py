@@ -0,0 +1,142 @@
+import importlib
+import json
+import os
+import threading
+import time
+
+import pytest
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+
+# The warm-up of every FY is not needed to build single insights
+os.environ.setdefault("PREWARM", "0")
+
+import app  # noqa: F401, registers the pages
+
+from pages.layouts.moneymoved_layout import unique_fy
+from utils.insight_digest import chart_digest
+from utils.insight_jobs import InsightJobStore, JOB_DONE
+from utils.insight_messages import InsightMessageStore
+from utils.local_insights import insight_engine
+
+money_moved = importlib.import_module("pages.money_moved")
+
+FY_WITHOUT_DATA = "FY1999-2000"
+CHART_ID = "money-moved-heatmap-graph"
+
+
+@pytest.mark.parametrize("selected_drilldown_by", ["", "payment_platform", "pledge_donor_chapter"])
+def test_trendline_insight_data_of_fy_without_data(selected_drilldown_by):
+    insight_data = money_moved.get_mm_monthly_trendline_insight_data(FY_WITHOUT_DATA, "payment_amount_usd", selected_drilldown_by)
+
+    assert insight_data["tables"]["monthly"].is_empty()
+    assert insight_data["notes"]["Data"] == "no money moved in this FY"
+    assert FY_WITHOUT_DATA in chart_digest(**insight_data)
+
+    insight = money_moved.local_chart_insights["money-moved-line-graph"](insight_data)
+    assert insight == insight_engine.empty_insight("monthly money moved")
+
+
+@pytest.fixture
+def ai_stores(tmp_path, monkeypatch):
+    """
+    Empty job and message stores for the AI insight callbacks, with the local insight engine instead of the LLM.
+    """
+    job_store = InsightJobStore(job_dir = tmp_path / "jobs")
+    message_store = InsightMessageStore(store_dir = tmp_path / "messages")
+    monkeypatch.setattr(money_moved, "insight_jobs", job_store)
+    monkeypatch.setattr(money_moved, "insight_messages", message_store)
+    monkeypatch.setattr(money_moved, "INSIGHT_ENGINE", "local")
+    return job_store, message_store
+
+
+def click_ai_icon(chart_id):
+    # Outside of a request Dash has no callback context, the AI icon of the chart is reported as the trigger
+    icon_id = json.dumps({"chart": chart_id, "type": "ai-icon"}, sort_keys = True, separators = (",", ":"))
+    context_value.set(AttributeDict(triggered_inputs = [{"prop_id": f"{icon_id}.n_clicks", "value": 1}]))
+
+    return money_moved.update_ai_insight([1], unique_fy[0], "payment_amount_usd", 10, "payment_amount_usd", "", "actual")
+
+
+def apply_patch(data, patch):
+    """
+    Applies the list operations of a Patch output to the client data, like the browser does.
+    """
+    data = list(data)
+    if patch is money_moved.dash.no_update:
+        return data
+    for operation in patch.to_plotly_json()["operations"]:
+        if operation["operation"] == "Append":
+            data.append(operation["params"]["value"])
+        elif operation["operation"] == "Remove":
+            data.remove(operation["params"]["value"])
+    return data
+
+
+def wait_for_jobs(job_store, job_ids, timeout = 10):
+    deadline = time.time() + timeout
+    while any(job_store.get(job_id)["status"] != JOB_DONE for job_id in job_ids):
+        assert time.time() < deadline, "the insight jobs did not finish"
+        time.sleep(0.01)
+
+
+def test_ai_insight_is_delivered_once(ai_stores):
+    job_store, message_store = ai_stores
+    session_id = message_store.new_session_id()
+
+    job_id_patch, loading_display = click_ai_icon(CHART_ID)
+    pending_job_ids = apply_patch([], job_id_patch)
+    assert len(pending_job_ids) == 1
+    assert loading_display == "show"
+
+    wait_for_jobs(job_store, pending_job_ids)
+    version, job_id_patch, loading_display, _ = money_moved.poll_ai_insight_jobs(1, pending_job_ids, session_id)
+
+    insight = job_store.get(pending_job_ids[0])["markdown"]
+    assert version == 1
+    assert message_store.get(session_id) == (1, [insight])
+    assert apply_patch(pending_job_ids, job_id_patch) == []
+    assert loading_display == "auto"
+
+    # A poll whose response the browser dropped left the finished job in the list, its insight is not added again
+    version, job_id_patch, _, _ = money_moved.poll_ai_insight_jobs(2, pending_job_ids, session_id)
+
+    assert version == 1
+    assert message_store.get(session_id) == (1, [insight])
+    assert apply_patch(pending_job_ids, job_id_patch) == []
+
+
+def test_poll_removes_only_finished_jobs(ai_stores):
+    job_store, message_store = ai_stores
+    session_id = message_store.new_session_id()
+
+    pending_job_ids = apply_patch([], click_ai_icon(CHART_ID)[0])
+    wait_for_jobs(job_store, pending_job_ids)
+
+    # The second click lands between the poll reading the list and the browser applying the poll output
+    release = threading.Event()
+    running_job_id = job_store.submit(CHART_ID, release.wait, 5)
+    polled_job_ids = list(pending_job_ids)
+    pending_job_ids = apply_patch(pending_job_ids, money_moved.poll_ai_insight_jobs(1, polled_job_ids, session_id)[1])
+    pending_job_ids = pending_job_ids + [running_job_id]
+
+    assert pending_job_ids == [running_job_id]
+    assert message_store.get(session_id)[0] == 1
+
+    _, job_id_patch, loading_display, _ = money_moved.poll_ai_insight_jobs(2, pending_job_ids, session_id)
+    release.set()
+
+    assert apply_patch(pending_job_ids, job_id_patch) == [running_job_id]
+    assert loading_display == "show"
+
+
+def test_unknown_job_ids_are_removed(ai_stores):
+    _, message_store = ai_stores
+    session_id = message_store.new_session_id()
+    pending_job_ids = ["0" * 32, "../outside"]
+
+    version, job_id_patch, _, _ = money_moved.poll_ai_insight_jobs(1, pending_job_ids, session_id)
+
+    assert version is money_moved.dash.no_update
+    assert apply_patch(pending_job_ids, job_id_patch) == []
+    assert message_store.get(session_id) == (0, [])
@@ -0,0 +1,21 @@
+"""
+Data directory and file names of the OFTW datasets.
+
+Kept apart from utils.data_loader, which loads every dataset when imported, so the data tools
+(utils.synthetic_data, utils.partition_writer) can use them without loading the data.
+"""
+from pathlib import Path
+import os
+
+# OFTW_DATA_DIR points the app at another data directory, e.g. synthetic data written by utils.synthetic_data
+DATA_DIR = Path(os.getenv("OFTW_DATA_DIR", Path(__file__)/'..'/'..'/'data')).resolve()
+
+parquet_files = {
+    "merged": "merged.parquet",
+    "pledges": "pledges.parquet",
+    "payments": "payments.parquet",
+    "pledge_active_arr": "pledge_active_arr.parquet",
+}
+
+# Portfolios which are not counted as money moved
+EXCLUDED_PORTFOLIOS = ["One for the World Discretionary Fund", "One for the World Operating Costs"]
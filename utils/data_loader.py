@@ -1,59 +1,419 @@
 import polars as pl
 
-from pathlib import Path
 import os
+import json
+import shutil
 import threading
 
-DATA_DIR = (Path(__file__)/'..'/'..'/'data').resolve()
+from utils.data_files import DATA_DIR, parquet_files, EXCLUDED_PORTFOLIOS
+
+class DataSnapshot:
+    """
+    One consistent version of the data: the lazy frames, the rollup cubes and the files they were read from.
+    A snapshot is never modified once built; reloads build a new one and swap it in.
+    """
+
+    def __init__(self):
+        self.dataframes = {}
+        self.file_paths = {}
+        self.fingerprints = {}
+        self.categories = {}
+        self.catalogs = {}
+        self.rollup_sources = {}
+
+    def get_data(self, dataset_name):
+        if dataset_name not in self.dataframes:
+            raise ValueError(f"Dataset '{dataset_name}' not found.")
+        return self.dataframes[dataset_name]
+
+    def get_fingerprint(self, dataset_name):
+        """
+        Returns the (mtime, size) of the file backing the dataset, taken when the snapshot was loaded.
+        Used as the version of cached results, so they are invalidated when a reload swaps in a new snapshot.
+        Rollup cubes share the fingerprint of their source dataset.
+        """
+        dataset_name = self.rollup_sources.get(dataset_name, dataset_name)
+        if dataset_name not in self.fingerprints:
+            raise ValueError(f"Dataset '{dataset_name}' not found.")
+        return self.fingerprints[dataset_name]
+
+    def get_categories(self, dataset_name, col_name):
+        """
+        Returns the Enum dictionary of a column, or None if the column is not encoded as an Enum.
+        """
+        dataset_name = self.rollup_sources.get(dataset_name, dataset_name)
+        return self.categories.get(dataset_name, {}).get(col_name)
+
+    def get_catalog_entry(self, dataset_name, col_name):
+        """
+        Returns {"values": [...], "counts": [...]} with the sorted distinct non-null values of a catalog column
+        and their row counts, or None if the column is not in the catalog.
+        """
+        return self.catalogs.get(dataset_name, {}).get(col_name)
+
 
 class DataLoader:
     _instance = None
     _lock = threading.Lock()    # Thread-safe singleton lock
 
-    def __new__(cls, file_names):
+    def __new__(cls, *args, **kwargs):
         if not cls._instance:
             with cls._lock:
                 if not cls._instance:
                     cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self, file_names):
+    def __init__(self, file_names, rollups = None, categorical_columns = None, catalog_columns = None, watch_interval = None):
         if not hasattr(self, 'dir_name'):  # Ensure attributes are initialized only once
             self.dir_name = DATA_DIR
-            self.dataframes = {}
+            self.snapshot_dir = DATA_DIR / ".snapshots"
+            self.file_names = file_names or {}
+            self.rollups = rollups or {}
+            self.categorical_columns = categorical_columns or {}
+            self.catalog_columns = catalog_columns or {}
             self.schema = {}
-            if file_names:
-                self._load_all(file_names)
+            self.watch_interval = watch_interval
+            self._reload_lock = threading.Lock()
+            self._watcher = None
+            self._stop_watcher = threading.Event()
+            self.snapshot = self._build_snapshot()
+            if watch_interval:
+                self.start_watcher(watch_interval)
 
-    def _load_all(self, file_names):
+    def _build_snapshot(self, previous = None):
+        """
+        Load every dataset and build the rollup cubes into a new DataSnapshot.
+        """
+        snapshot = DataSnapshot()
+        self._load_all(snapshot, self.file_names, previous)
+        self._build_rollups(snapshot, self.rollups)
+        return snapshot
+
+    def _load_all(self, snapshot, file_names, previous = None):
         """
         Load multiple files (CSV and Parquet) into lazy Polars DataFrames.
         """
         for name, path in file_names.items():
-            full_path = os.path.join(self.dir_name, path)
-            self.dataframes[name] = self._load_file(full_path)
+            full_path = self._resolve_path(path)
+            fingerprint = self.file_fingerprint(full_path)
+
+            snapshot.fingerprints[name] = fingerprint
+
+            # Unchanged files are carried over from the previous snapshot as they are
+            if previous is not None and previous.fingerprints.get(name) == fingerprint:
+                snapshot.file_paths[name] = previous.file_paths[name]
+                snapshot.dataframes[name] = previous.dataframes[name]
+                if name in previous.categories:
+                    snapshot.categories[name] = previous.categories[name]
+                if name in previous.catalogs:
+                    snapshot.catalogs[name] = previous.catalogs[name]
+                continue
+
+            # In watch mode, scan a private copy of the file so in-flight queries never see a half-replaced file
+            scan_path = self._copy_to_snapshot_dir(full_path, fingerprint) if self.watch_interval else full_path
+            lf = self._load_file(scan_path)
+
+            # Hive partition columns stay as they are, casting them would disable partition pruning
+            columns = [
+                col_name for col_name in self.categorical_columns.get(name, [])
+                if col_name not in self._partition_columns(scan_path)
+            ]
+            if columns:
+                categories = self._load_dictionaries(name, lf, columns)
+                lf = lf.with_columns([pl.col(col_name).cast(pl.Enum(categories[col_name])) for col_name in columns])
+                snapshot.categories[name] = categories
+
+            if self.catalog_columns.get(name):
+                snapshot.catalogs[name] = self._load_catalog(name, lf, self.catalog_columns[name], fingerprint)
+
+            snapshot.file_paths[name] = scan_path
+            snapshot.dataframes[name] = lf
+
+    def _load_catalog(self, name, lf, columns, fingerprint):
+        """
+        Returns the distinct values and counts of the catalog columns for this version of the dataset.
+        The catalog is stored in the data/<name>.catalog.json sidecar together with the file fingerprint,
+        so it is only recomputed (in a single pass over the data) when the file changes.
+        """
+        catalog_path = self.dir_name / f"{name}.catalog.json"
+
+        if catalog_path.exists():
+            with open(catalog_path, "r") as f:
+                catalog = json.load(f)
+            if catalog.get("fingerprint") == list(fingerprint) and all(col_name in catalog["columns"] for col_name in columns):
+                return {col_name: catalog["columns"][col_name] for col_name in columns}
+
+        value_counts = pl.collect_all([
+            lf.filter(pl.col(col_name).is_not_null()).group_by(col_name).agg(pl.len().alias("count")).sort(col_name)
+            for col_name in columns
+        ])
+
+        catalog_columns = {
+            col_name: {"values": df[col_name].to_list(), "counts": df["count"].to_list()}
+            for col_name, df in zip(columns, value_counts)
+        }
+
+        tmp_path = f"{catalog_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fingerprint": list(fingerprint), "columns": catalog_columns}, f, default = str)
+        os.replace(tmp_path, catalog_path)
+
+        return catalog_columns
+
+    def _load_dictionaries(self, name, lf, columns):
+        """
+        Returns the Enum dictionaries of the columns, persisted in data/<name>.dictionaries.json.
+        Values missing from the persisted dictionaries are merged in, dictionaries of columns no longer encoded
+        are dropped, and the file is rewritten. Dictionaries are kept sorted, so sorting an Enum column matches
+        sorting its strings.
+        """
+        dictionary_path = self.dir_name / f"{name}.dictionaries.json"
+
+        dictionaries = {}
+        if dictionary_path.exists():
+            with open(dictionary_path, "r") as f:
+                dictionaries = json.load(f)
+
+        distinct_values = lf.select([pl.col(col_name).drop_nulls().unique().implode() for col_name in columns]).collect()
+
+        changed = not dictionaries.keys() <= set(columns)
+        dictionaries = {col_name: values for col_name, values in dictionaries.items() if col_name in columns}
+        for col_name in columns:
+            known_values = set(dictionaries.get(col_name, []))
+            values = known_values | set(distinct_values[col_name][0].to_list())
+            if col_name not in dictionaries or values != known_values:
+                dictionaries[col_name] = sorted(values)
+                changed = True
+
+        if changed:
+            tmp_path = f"{dictionary_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(dictionaries, f, indent = 2, sort_keys = True)
+            os.replace(tmp_path, dictionary_path)
+
+        return {col_name: dictionaries[col_name] for col_name in columns}
+
+    def _partition_columns(self, path):
+        """
+        Returns the hive partition column names of a partitioned directory (empty for plain files).
+        """
+        if not os.path.isdir(path):
+            return set()
+        return {entry.split("=", 1)[0] for entry in os.listdir(path) if "=" in entry}
+
+    def _build_rollups(self, snapshot, rollups):
+        """
+        Pre-aggregate the source datasets into in-memory rollup cubes.
+        Each cube is registered as a dataset of its own, so it can be queried like any other one.
+        """
+        for name, spec in rollups.items():
+            lf = snapshot.get_data(spec["source"])
+            if spec.get("filter") is not None:
+                lf = lf.filter(spec["filter"])
+
+            aggregations = [pl.col(measure).sum() for measure in spec["measures"]]
+            if spec.get("count"):
+                aggregations.append(pl.len().alias(spec["count"]))
+
+            cube_df = lf.group_by(spec["dimensions"]).agg(aggregations).collect()
+
+            snapshot.rollup_sources[name] = spec["source"]
+            snapshot.dataframes[name] = cube_df.lazy()
+
+    def _resolve_path(self, path):
+        """
+        Returns the full path of a data file, preferring a hive partitioned directory with the same name
+        (e.g. data/merged/ over data/merged.parquet) when one has been written by utils.partition_writer.
+        """
+        full_path = os.path.join(self.dir_name, path)
+        partitioned_dir = os.path.splitext(full_path)[0]
+        if full_path.endswith('.parquet') and os.path.isdir(partitioned_dir):
+            return partitioned_dir
+        return full_path
 
     def _load_file(self, path):
         """
-        Detects the file type (CSV or Parquet) and loads it lazily.
+        Detects the file type (CSV, Parquet or hive partitioned Parquet directory) and loads it lazily.
         """
-        if path.endswith('.csv'):
+        if os.path.isdir(path):
+            # Filters on the partition columns skip whole files
+            return pl.scan_parquet(os.path.join(path, "**", "*.parquet"), hive_partitioning = True)
+        elif path.endswith('.csv'):
             return pl.scan_csv(path)  # Lazy CSV loading
         elif path.endswith('.parquet'):
             return pl.scan_parquet(path)  # Lazy Parquet loading
         else:
             raise ValueError(f"Unsupported file format: {path}")
 
+    def _copy_to_snapshot_dir(self, path, fingerprint):
+        """
+        Copies a data file into the snapshot directory under a versioned name and returns the copy's path.
+        """
+        self.snapshot_dir.mkdir(parents = True, exist_ok = True)
+        base, ext = os.path.splitext(os.path.basename(path))
+        snapshot_path = str(self.snapshot_dir / f"{base}-{fingerprint[0]}-{fingerprint[1]}{ext}")
+
+        if not os.path.exists(snapshot_path):
+            tmp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if os.path.isdir(path):
+                shutil.copytree(path, tmp_path)
+            else:
+                shutil.copy2(path, tmp_path)
+            os.replace(tmp_path, snapshot_path)
+
+        return snapshot_path
+
+    def _cleanup_snapshot_dir(self, keep, versions_to_keep = 2):
+        """
+        Removes old snapshot copies, keeping the newest versions of every file and the ones listed in `keep`.
+        Other workers may still be reading the previous version, so it is kept around as well.
+        """
+        if not self.snapshot_dir.exists():
+            return
+
+        versions = {}
+        for entry in self.snapshot_dir.iterdir():
+            if entry.suffix == ".tmp":
+                continue
+            base, mtime, _ = entry.stem.rsplit("-", 2)
+            versions.setdefault((base, entry.suffix), []).append((int(mtime), entry))
+
+        for entries in versions.values():
+            for _, entry in sorted(entries, reverse = True)[versions_to_keep:]:
+                if str(entry) in keep:
+                    continue
+                try:
+                    if entry.is_dir():
+                        shutil.rmtree(entry)
+                    else:
+                        entry.unlink()
+                except OSError as e:
+                    print(f"Error removing data snapshot {entry}: {e}")
+
+    @staticmethod
+    def file_fingerprint(path):
+        """
+        Returns the (mtime, size) of a data file.
+        For a partitioned directory, the newest mtime and the total size of its files.
+        """
+        if os.path.isdir(path):
+            stats = [os.stat(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files]
+            return (max((stat.st_mtime_ns for stat in stats), default = 0), sum(stat.st_size for stat in stats))
+
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get_snapshot(self):
+        """
+        Returns the current DataSnapshot. Hold on to it to run several queries against the same data version.
+        """
+        return self.snapshot
+
     def get_data(self, dataset_name):
-        if dataset_name not in self.dataframes:
-            raise ValueError(f"Dataset '{dataset_name}' not found.")
-        return self.dataframes[dataset_name]
+        return self.snapshot.get_data(dataset_name)
+
+    def get_fingerprint(self, dataset_name):
+        return self.snapshot.get_fingerprint(dataset_name)
+
+    def get_categories(self, dataset_name, col_name):
+        return self.snapshot.get_categories(dataset_name, col_name)
+
+    def get_catalog_entry(self, dataset_name, col_name):
+        return self.snapshot.get_catalog_entry(dataset_name, col_name)
+
+    def reload(self):
+        """
+        Rebuilds the snapshot if any data file changed and atomically swaps it in.
+        Queries which already hold the old snapshot keep running against it.
+
+        Returns:
+        - bool: True if a new snapshot was swapped in.
+        """
+        with self._reload_lock:
+            previous = self.snapshot
+            fingerprints = {
+                name: self.file_fingerprint(self._resolve_path(path))
+                for name, path in self.file_names.items()
+            }
+            if fingerprints == previous.fingerprints:
+                return False
+
+            snapshot = self._build_snapshot(previous)
+            self.snapshot = snapshot
+
+            if self.watch_interval:
+                self._cleanup_snapshot_dir(set(snapshot.file_paths.values()) | set(previous.file_paths.values()))
+
+            return True
+
+    def start_watcher(self, interval = 10):
+        """
+        Starts a background thread which polls the data files every `interval` seconds and reloads them when they change.
+        A change is only picked up once the file has been stable for one full interval, so half-written files are skipped.
+        """
+        if self._watcher and self._watcher.is_alive():
+            return
+
+        self._stop_watcher.clear()
+        self._watcher = threading.Thread(target = self._watch, args = (interval,), name = "data-loader-watcher", daemon = True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_watcher.set()
+
+    def _watch(self, interval):
+        last_seen = None
+        while not self._stop_watcher.wait(interval):
+            try:
+                current = {
+                    name: self.file_fingerprint(self._resolve_path(path))
+                    for name, path in self.file_names.items()
+                }
+                if current != self.snapshot.fingerprints and current == last_seen:
+                    self.reload()
+                last_seen = current
+            except Exception as e:
+                print(f"Error reloading data files: {e}")
+
+# Aggregate cubes built once at load time, queried instead of the payment level data
+rollup_cubes = {
+    "merged_rollup": {
+        "source": "merged",
+        # Compared as strings, the Enum dictionary might not contain every excluded portfolio
+        "filter": ~pl.col("payment_portfolio").cast(pl.String).is_in(EXCLUDED_PORTFOLIOS),
+        "dimensions": [
+            "payment_date_fy", "payment_date_fm", "payment_date_calendar_month", "payment_date_calendar_monthyear",
+            "pledge_frequency_type", "payment_platform", "pledge_chapter_type", "pledge_donor_chapter",
+        ],
+        "measures": ["payment_amount_usd", "payment_cf_amount_usd"],
+        "count": "payment_count",
+    },
+}
+
+# Low-cardinality string columns loaded as pl.Enum, with their dictionaries persisted in data/<dataset>.dictionaries.json.
+# The filter columns (payment_date_fy, payment_portfolio) stay strings like the hive partition columns: a filter on a
+# cast column is not pushed into the parquet scan and cannot skip row groups by their statistics.
+categorical_columns = {
+    "merged": [
+        "payment_platform", "pledge_chapter_type", "pledge_frequency_type", "pledge_donor_chapter",
+    ],
+    "pledges": ["pledge_chapter_type", "pledge_donor_chapter"],
+    "payments": ["payment_platform"],
+}
 
-parquet_files = {
-    "merged": "merged.parquet",
-    "pledges": "pledges.parquet",
-    "payments": "payments.parquet",
-    "pledge_active_arr": "pledge_active_arr.parquet",
+# Dimension columns whose distinct values and counts are served from the data/<dataset>.catalog.json sidecar
+catalog_columns = {
+    "merged": [
+        "payment_date_fy", "payment_date_fm", "payment_platform", "pledge_chapter_type",
+        "pledge_frequency_type", "payment_portfolio", "pledge_donor_chapter",
+    ],
 }
 
-data_loader = DataLoader(parquet_files)
\ No newline at end of file
+# Set DATA_WATCH_INTERVAL (seconds) to hot reload the data files when they are replaced
+data_loader = DataLoader(
+    parquet_files,
+    rollups = rollup_cubes,
+    categorical_columns = categorical_columns,
+    catalog_columns = catalog_columns,
+    watch_interval = float(os.getenv("DATA_WATCH_INTERVAL", 0)) or None,
+)
@@ -5,19 +5,46 @@ import os
 from pathlib import Path
 
 import json
+import hashlib
 import cairosvg  # You'll need to install this: pip install cairosvg
 import base64
 import re
+import tempfile
+import threading
 from PIL import Image
 from io import BytesIO
 
 from utils.data_loader import data_loader
+from utils.result_cache import ResultCache
+from utils.insight_cache import InsightCache
+from utils.timing import stage, timed
 
 # Set up OpenAI API (ensure this is your valid API key)
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 LOGO_DIR = (Path(__file__)/'..'/'..'/'data/downloaded_logos/').resolve()
 
+# Collected query results shared by every DataPreparer (bounded by total bytes, default 256 MB)
+result_cache = ResultCache(max_bytes = int(os.getenv("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024)))
+
+# AI insights shared by all worker processes, keyed by the hash of the prompt input (default 1 day, 50 MB)
+insight_cache = InsightCache(
+    cache_dir = os.getenv("INSIGHT_CACHE_DIR", Path(tempfile.gettempdir()) / "oftw-insight-cache"),
+    ttl = float(os.getenv("INSIGHT_CACHE_TTL", 24 * 3600)),
+    max_bytes = int(os.getenv("INSIGHT_CACHE_MAX_BYTES", 50 * 1024 * 1024)),
+)
+
+# Bump when the prompt or the model changes, so cached insights of the old prompt are not reused
+INSIGHT_PROMPT_VERSION = "2"
+LLM_MODEL = "gpt-3.5-turbo"
+# Stream completions so the insight panel shows the text as it is generated (LLM_STREAM=0 waits for the full answer)
+LLM_STREAM = os.getenv("LLM_STREAM", "1") != "0"
+# "openai", or "local" for the offline statistical insights (utils.local_insights) without any LLM request
+INSIGHT_ENGINE = os.getenv("INSIGHT_ENGINE", "openai")
+
+# Striped locks serializing the computation of cache misses per filtered dataset
+_bundle_locks = [threading.Lock() for _ in range(64)]
+
 class DataPreparer:
     def __init__(self):
         pass
@@ -25,7 +52,12 @@ class DataPreparer:
     def get_col_unique_values(self, dataset_name, col_name, sort_desc = False):
         """
         Retrieves the unique list of column from the dataset.
+        Catalog columns are served from the precomputed catalog, other columns are scanned.
         """
+        catalog_entry = data_loader.get_catalog_entry(dataset_name, col_name)
+        if catalog_entry is not None:
+            return catalog_entry["values"][::-1] if sort_desc else list(catalog_entry["values"])
+
         lf = data_loader.get_data(dataset_name)
         return lf.filter(pl.col(col_name).is_not_null()).select(col_name).unique().sort(by = col_name, descending = sort_desc).collect().to_series().to_list()
     
@@ -33,6 +65,10 @@ class DataPreparer:
         """
         Retrieves the count of unique values in the column.
         """
+        catalog_entry = data_loader.get_catalog_entry(dataset_name, col_name)
+        if catalog_entry is not None:
+            return len(catalog_entry["values"])
+
         lf = data_loader.get_data(dataset_name)
         return lf.filter(pl.col(col_name).is_not_null()).select(pl.col(col_name).n_unique()).collect().item()
     
@@ -62,7 +98,7 @@ class DataPreparer:
         """
         return lf.filter(pl.col(column_name).is_not_null()).select(pl.col(column_name).n_unique()).collect().item()
     
-    def filter_data(self, dataset_name, filters = None, columns = None, logic = "AND"):
+    def filter_data(self, dataset_name, filters = None, columns = None, logic = "AND", snapshot = None):
         """
         Generic method to filter and select columns from a dataset.
 
@@ -71,15 +107,17 @@ class DataPreparer:
         - filters (list of tuples): [(canonical_name, operator, value)], e.g., [("center_id", "==", 123)].
         - columns (list of str): Canonical column names to return.
         - logic (str): "AND" (default) or "OR" for combining filters.
+        - snapshot (DataSnapshot): Data version to query, defaults to the current one.
 
         Returns:
         - LazyFrame: Filtered and projected dataset.
         """
-        lf = data_loader.get_data(dataset_name)
+        snapshot = snapshot or data_loader.get_snapshot()
+        lf = snapshot.get_data(dataset_name)
 
         # Apply filters if provided
         if filters:
-            expressions = [self._build_filter_expr(dataset_name, f) for f in filters]
+            expressions = [self._build_filter_expr(dataset_name, f, snapshot) for f in filters]
             # print(expressions)
             # combined_filter = pl.all(expressions) if logic == "AND" else pl.any(expressions)
             # print(combined_filter)
@@ -91,12 +129,190 @@ class DataPreparer:
 
         return lf
 
-    def _build_filter_expr(self, dataset_name, filter_tuple):
+    def collect_bundle(self, queries):
+        """
+        Executes a bundle of named LazyFrames derived from a common base in a single pass.
+
+        The queries are collected together with `pl.collect_all` and common-subplan
+        elimination, so the shared scan/filter of the base is only executed once.
+
+        Parameters:
+        - queries (dict of str -> LazyFrame): Named queries, e.g., {"total": lf.select(...), "monthly": lf.group_by(...)}.
+
+        Returns:
+        - dict of str -> DataFrame: Collected results, keyed by the same names.
+        """
+        names = list(queries.keys())
+        with stage("query"):
+            frames = pl.collect_all([queries[name] for name in names])
+
+        return dict(zip(names, frames))
+
+    def collect_filtered(self, dataset_name, filters = None, columns = None, plan = None, plan_key = None):
+        """
+        Cached equivalent of `plan(filter_data(dataset_name, filters, columns)).collect()`.
+
+        Parameters:
+        - dataset_name (str): Dataset to query.
+        - filters (list of tuples): [(canonical_name, operator, value)], same as filter_data.
+        - columns (list of str): Canonical column names to return.
+        - plan (callable): Optional downstream plan, LazyFrame -> LazyFrame, applied to the filtered data.
+        - plan_key (hashable): Name and arguments identifying the plan, e.g., ("dumbbell", selected_fy, top_n).
+          A plan without a plan_key is executed on every call.
+
+        Returns:
+        - DataFrame: Collected result, served from the result cache when the same query was run
+          against the current version of the dataset file.
+        """
+        return self.collect_filtered_bundle(dataset_name, {"result": plan}, filters, columns, plan_key)["result"]
+
+    def collect_filtered_bundle(self, dataset_name, plans, filters = None, columns = None, plan_key = None):
+        """
+        Cached equivalent of collect_bundle for several downstream plans over one filtered dataset.
+        Only the plans missing from the result cache are executed, together in a single pass.
+
+        Parameters:
+        - dataset_name (str): Dataset to query.
+        - plans (dict of str -> callable): Named downstream plans, LazyFrame -> LazyFrame (None returns the filtered data).
+        - filters (list of tuples): [(canonical_name, operator, value)], same as filter_data.
+        - columns (list of str): Canonical column names to return.
+        - plan_key (hashable): Name and arguments identifying the bundle, the results are cached by (plan_key, plan name).
+          Without a plan_key only the plans that are None are cached.
+
+        Returns:
+        - dict of str -> DataFrame: Collected results, keyed by the same names as plans.
+        """
+        # Pin one data version, so a reload in between cannot mix up cached versions and results
+        snapshot = data_loader.get_snapshot()
+        version = snapshot.get_fingerprint(dataset_name)
+        base_key = (dataset_name, self._normalize_filters(filters), tuple(columns) if columns else None)
+
+        results = {}
+        misses = {}
+        for name, plan in plans.items():
+            key = self._cache_key(base_key, plan, plan_key, name)
+            frame = result_cache.get(key, version) if key else None
+            if frame is not None:
+                results[name] = frame
+            else:
+                misses[name] = (key, plan)
+
+        if misses:
+            try:
+                # Callbacks fired by the same input run in parallel; only one of them computes a missing query
+                with _bundle_locks[hash(base_key) % len(_bundle_locks)]:
+                    for name, (key, _) in list(misses.items()):
+                        frame = result_cache.get(key, version) if key else None
+                        if frame is not None:
+                            results[name] = frame
+                            del misses[name]
+
+                    if misses:
+                        base_lf = self.filter_data(dataset_name, filters, columns, snapshot = snapshot)
+                        collected = self.collect_bundle({name: plan(base_lf) if plan else base_lf for name, (_, plan) in misses.items()})
+                        for name, frame in collected.items():
+                            if misses[name][0]:
+                                result_cache.put(misses[name][0], version, frame)
+                            results[name] = frame
+            except (pl.exceptions.InvalidOperationError, pl.exceptions.ComputeError):
+                # Without watch mode the scans read the live files, so a replaced file fails the scan of the old file, or
+                # the Enum cast when it has values missing from the dictionaries. Reloading the changed files extends the
+                # dictionaries, then the query runs again against the new snapshot; other errors are raised.
+                if not data_loader.reload():
+                    raise
+                return self.collect_filtered_bundle(dataset_name, plans, filters, columns, plan_key)
+
+        return {name: results[name] for name in plans}
+
+    def top_k_with_other(self, lf, group_col, metric, k, by = None, sum_cols = None, order = "metric",
+                         other_label = "Other", unknown_label = "Unknown"):
+        """
+        Plan keeping the k values of group_col with the largest total metric and summing all other values into one
+        other_label row (per by group). Missing values are labelled unknown_label and rank like any other value.
+
+        Rows are ordered by total metric, largest first (order = "metric"), or by name (order = "name"),
+        with other_label and then unknown_label pinned last, and by the by columns within a value.
+
+        Parameters:
+        - lf (LazyFrame): Data with group_col, the by columns and the summed columns.
+        - group_col (str): Column whose values are ranked, e.g., "pledge_donor_chapter".
+        - metric (str): Column whose sum ranks the values, one of sum_cols.
+        - k (int): Number of values kept.
+        - by (list of str): Further grouping columns kept in the result, e.g., the fiscal month of a trendline.
+        - sum_cols (list of str): Columns summed per group, defaults to [metric].
+        - order (str): "metric" or "name".
+        - other_label (str): Label of the remainder.
+        - unknown_label (str): Label of missing values.
+
+        Returns:
+        - LazyFrame: One row per (by, group_col) group with the summed columns, group_col as String.
+        """
+        by = list(by or [])
+        sum_cols = list(sum_cols or [metric])
+
+        lf = lf.with_columns(pl.col(group_col).cast(pl.String).fill_null(unknown_label))
+
+        # Ties are broken by name, so the cut at k is deterministic
+        top_values = (
+            lf.group_by(group_col)
+            .agg(pl.col(metric).sum().alias("_total"))
+            .sort(["_total", group_col], descending = [True, False])
+            .head(k)
+            .select(group_col, pl.lit(True).alias("_is_top"))
+        )
+
+        sort_cols = ["_pin"] + (["_total", group_col] if order == "metric" else [group_col]) + by
+        return (
+            lf.join(top_values, on = group_col, how = "left")
+            .with_columns(pl.when(pl.col("_is_top")).then(pl.col(group_col)).otherwise(pl.lit(other_label)).alias(group_col))
+            .group_by(by + [group_col])
+            .agg([pl.col(col).sum() for col in sum_cols])
+            .with_columns([
+                pl.when(pl.col(group_col) == unknown_label).then(2).when(pl.col(group_col) == other_label).then(1).otherwise(0).alias("_pin"),
+                pl.col(metric).sum().over(group_col).alias("_total"),
+            ])
+            .sort(sort_cols, descending = [col == "_total" for col in sort_cols])
+            .drop(["_pin", "_total"])
+        )
+
+    def _normalize_filters(self, filters):
+        """
+        Helper to turn filter tuples into a hashable, order-independent cache key.
+        """
+        if not filters:
+            return ()
+
+        normalized = []
+        for col_name, operator, value in filters:
+            if isinstance(value, (list, tuple, set)):
+                value = tuple(sorted(value, key = repr))
+            normalized.append((col_name, operator, value))
+
+        return tuple(sorted(normalized, key = repr))
+
+    def _cache_key(self, base_key, plan, plan_key, name):
+        """
+        Helper to build the result cache key of a downstream plan from the normalized (dataset, filters, columns)
+        and the plan's (plan_key, name). Returns None for a plan without plan_key, which is not cached.
+        """
+        if plan is None:
+            return base_key + (None,)
+        if plan_key is None:
+            return None
+        return base_key + ((plan_key, name),)
+
+    def _build_filter_expr(self, dataset_name, filter_tuple, snapshot = None):
         """
         Helper to convert (canonical_name, operator, value) to a Polars expression.
         """
         col_name, operator, value = filter_tuple
 
+        # Enum columns reject values outside of their dictionary, and those values can never match anyway
+        categories = (snapshot or data_loader).get_categories(dataset_name, col_name)
+        if categories is not None and operator in ["in", "not_in"] and isinstance(value, list):
+            known_values = set(categories)
+            value = [v for v in value if v in known_values]
+
         # Handle None values
         if operator in ["not_null", "null"]:
             if operator == "not_null":
@@ -120,29 +336,39 @@ class DataPreparer:
 
         return ops[operator]
     
-    def get_llm_insight(self, plotly_fig_data):
+    @timed("llm")
+    def get_llm_insight(self, chart_data, on_partial = None, fallback_insight = None):
         """
         Placeholder for LLM insight retrieval.
+        chart_data is the compact digest of the chart (see utils.insight_digest), not the plotly figure JSON.
+        Insights are served from the insight cache when the same chart data was explained before.
+        With on_partial, the completion is streamed and on_partial is called with the text received so far after every chunk.
+        fallback_insight is returned (and not cached) when the LLM request fails.
         """
+        cache_key = self._insight_cache_key(chart_data)
+        cached_insight = insight_cache.get(cache_key)
+        if cached_insight is not None:
+            return cached_insight
 
         prompt = """
             You are an AI assistant for the OFTW (One for the World is a movement aimed at revolutionizing charitable giving to 
             eradicate extreme poverty by educating and motivating people to donate effectively.) dashboard.
-            Based on the plotly figure data below, provide:  
+            Based on the chart data below, provide:  
             1. A short (1 line) summary of what the graph shows. 
             2. 2 key insights from the data. 
             3. 2 actionable suggestions for organization.  
-            Plotly Figure Data: {}
+            Chart Data:
+{}
             Please provide the insights in a markdown format, such as:
             1. Summary: [Your summary here]
             2. Key Insights: [Your insights here]
             3. Action Suggestions: [Your suggestions here]
             Use plain language and keep it concise. 
-        """.format(plotly_fig_data)
+        """.format(chart_data)
 
         try:
             response = openai.chat.completions.create(
-                model="gpt-3.5-turbo",
+                model=LLM_MODEL,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
@@ -150,13 +376,31 @@ class DataPreparer:
                 n=1,
                 stop=None,
                 temperature=0.7,
+                stream=on_partial is not None,
             )
-            return response.choices[0].message.content
+
+            if on_partial is None:
+                insight = response.choices[0].message.content
+            else:
+                insight = ""
+                for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        insight += chunk.choices[0].delta.content
+                        on_partial(insight)
         except Exception as e:
             print(f"Error in LLM insight retrieval: {e}")
             # Handle error (e.g., log it, raise it, etc.)
-            # For now, return a placeholder
-            return "LLM could not generate insight."
+            # Return the fallback insight if there is one, or a placeholder
+            return fallback_insight or "LLM could not generate insight."
+
+        insight_cache.put(cache_key, insight)
+        return insight
+
+    def _insight_cache_key(self, chart_data):
+        """
+        Helper to hash the chart data with the prompt version and the model.
+        """
+        return hashlib.sha256(f"{INSIGHT_PROMPT_VERSION}|{LLM_MODEL}|{chart_data}".encode()).hexdigest()
         
     # Load logo mappings
     def load_logo_mappings(self):
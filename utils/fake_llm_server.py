@@ -0,0 +1,156 @@
+"""
+A local fake of the OpenAI chat completions endpoint, for running the AI insights offline and in tests.
+
+It answers POST /v1/chat/completions with a canned markdown insight after a configurable delay,
+in the same response format as OpenAI, so the openai client can be pointed at it unchanged.
+Requests with "stream": true get the insight word by word as server-sent events, like the OpenAI streaming API.
+
+Usage:
+    python -m utils.fake_llm_server --port 8765 --delay 2 --chunk-delay 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python app.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+
+
+def fake_insight(prompt):
+    """
+    Returns a deterministic markdown insight in the format the dashboard prompt asks for.
+    """
+    return (
+        "1. Summary: Fake insight for a prompt of {:,} characters.\n"
+        "2. Key Insights:\n"
+        "   - This answer comes from the local fake LLM server.\n"
+        "   - No OpenAI request was made.\n"
+        "3. Action Suggestions:\n"
+        "   - Point OPENAI_BASE_URL at the OpenAI API for real insights.\n"
+        "   - Use the fake server for offline development and tests."
+    ).format(len(prompt))
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    delay = 0.0
+    chunk_delay = 0.0
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+        content = fake_insight(prompt)
+
+        time.sleep(self.delay)
+
+        if body.get("stream"):
+            self._send_stream(body, content)
+            return
+
+        # A complete answer takes as long as streaming all of its chunks
+        time.sleep(self.chunk_delay * len(content.split()))
+
+        response = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        }
+        self._send_json(response)
+
+    def _send_stream(self, body, content):
+        """
+        Sends the content as chat.completion.chunk events, one word per chunk, chunk_delay seconds apart.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = re.findall(r"\S*\s*", content)
+        deltas = [{"role": "assistant", "content": ""}] + [{"content": word} for word in words if word]
+
+        for i, delta in enumerate(deltas + [{}]):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": None if delta else "stop",
+                }],
+            }
+            if i > 1:
+                time.sleep(self.chunk_delay)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, data):
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host = "127.0.0.1", port = 8765, delay = 0.0, chunk_delay = 0.0):
+    """
+    Returns the fake LLM HTTP server. Port 0 picks a free port (see server.server_port).
+
+    Parameters:
+    - host (str): Interface to listen on.
+    - port (int): Port to listen on.
+    - delay (float): Seconds to wait before answering, to mimic the latency of a real completion.
+    - chunk_delay (float): Seconds between two chunks of a streamed answer.
+    """
+    handler = type("ConfiguredFakeLLMHandler", (FakeLLMHandler,), {"delay": delay, "chunk_delay": chunk_delay})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_background(port = 0, delay = 0.0, chunk_delay = 0.0):
+    """
+    Starts the fake LLM server on a daemon thread and returns (server, base_url) for OPENAI_BASE_URL.
+    """
+    server = make_server(port = port, delay = delay, chunk_delay = chunk_delay)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+
+    return server, f"http://127.0.0.1:{server.server_port}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Run a local fake of the OpenAI chat completions endpoint.")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--delay", type = float, default = 1.0, help = "Seconds before each answer")
+    parser.add_argument("--chunk-delay", type = float, default = 0.05, help = "Seconds between the chunks of a streamed answer")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.delay, args.chunk_delay)
+    print(f"Fake LLM server on http://{args.host}:{server.server_port}/v1")
+    server.serve_forever()
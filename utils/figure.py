@@ -8,6 +8,7 @@ import dash_ag_grid as dag
 import dash_bootstrap_components as dbc
 
 import math
+import os
 import polars as pl
 import pandas as pd
 import numpy as np
@@ -19,9 +20,14 @@ from PIL import Image
 from io import BytesIO
 
 from utils.data_preparer import DataPreparer
+from utils.timing import stage, timed
+from utils.figure_cache import FigureCache
 
 data_preparer = DataPreparer()
 
+# Rendered figures of the chart callbacks, shared by every session of the worker process (bounded by entry count, default 256)
+figure_cache = FigureCache(max_entries = int(os.getenv("FIGURE_CACHE_MAX_ENTRIES", 256)))
+
 # Define your total target ARR
 TOTAL_TARGET = 1_200_000
 
@@ -55,6 +61,10 @@ class Figure:
         [1.0, colors['secondary']]    # End with primary
     ]
 
+    # Node colors of the ARR Sankey levels (left to right) and of its sink nodes
+    sankey_level_colors = [colors["primary"], colors["accent"], colors["light"], colors["text"]]
+    sankey_sink_colors = {"Actual ARR": "#2D6A4F", "Gap to Target": "#D00000"}
+
     def __init__(self):
         pass
 
@@ -117,6 +127,7 @@ class Figure:
 
         return trace
 
+    @timed("figure")
     def create_kpi_card(self, value, goal, body_text = "Funds Raised"):
         return html.Div([
         html.H3(f"${value:,.2f}", 
@@ -139,6 +150,49 @@ class Figure:
                })
     ])
 
+    @timed("figure")
+    def create_figure_variants(self, figures):
+        """
+        Splits figures which only differ in some trace and layout properties, e.g. one figure per amount type,
+        into the properties they share and the properties of each variant, so the browser gets the shared part once.
+        The clientside select_amount_type_figure merges the selected variant into the shared figure.
+
+        Parameters:
+        - figures (dict of str -> go.Figure): The figure of each variant, keyed by the variant name.
+
+        Returns:
+        - dict: {"figure": shared figure JSON, "variants": {name: {"traces": [...], "layout": {...}}}}, with the
+          varying properties of every trace in "traces", or the complete traces in "data" when the trace counts differ.
+        """
+        figure_jsons = [json.loads(figure.to_json()) for figure in figures.values()]
+
+        def varying_keys(dicts):
+            return {key for key in set().union(*dicts) if any(d.get(key) != dicts[0].get(key) for d in dicts)}
+
+        def pick(d, keys, keep):
+            return {key: value for key, value in d.items() if (key in keys) == keep}
+
+        layout_keys = varying_keys([figure_json["layout"] for figure_json in figure_jsons])
+        trace_keys = None
+        if len({len(figure_json["data"]) for figure_json in figure_jsons}) == 1:
+            trace_keys = [varying_keys(list(traces)) for traces in zip(*(figure_json["data"] for figure_json in figure_jsons))]
+
+        variants = {}
+        for name, figure_json in zip(figures, figure_jsons):
+            variants[name] = {"layout": pick(figure_json["layout"], layout_keys, True)}
+            if trace_keys is None:
+                variants[name]["data"] = figure_json["data"]
+            else:
+                variants[name]["traces"] = [pick(trace, keys, True) for trace, keys in zip(figure_json["data"], trace_keys)]
+
+        shared_figure = {
+            "data": [] if trace_keys is None else [pick(trace, keys, False) for trace, keys in zip(figure_jsons[0]["data"], trace_keys)],
+            "layout": pick(figure_jsons[0]["layout"], layout_keys, False),
+        }
+
+        return {"figure": shared_figure, "variants": variants}
+
+    @timed("figure")
     def create_monthly_mm_graph(self, df, y_col_name, target):
         """
         """
@@ -279,6 +333,7 @@ class Figure:
 
         return fig
 
+    @timed("figure")
     def create_goal_target_gauge_graph(self, value, goal):
         """
         """
@@ -318,6 +373,7 @@ class Figure:
 
         return fig
     
+    @timed("figure")
     def create_title_card(self, body_text, header_text = None, footer_text = None, card_width = "18rem"):
         """
         Create a title card.
@@ -340,6 +396,7 @@ class Figure:
             ], style = dict(width = card_width, flex = 1),), 
         ])
     
+    @timed("figure")
     def create_money_mural_mosaic(self, df: pl.DataFrame):
         """
         Given a Polars DataFrame with columns:
@@ -437,35 +494,40 @@ class Figure:
 
         return fig
     
+    @timed("figure")
     def create_calendarplot(self, df: pl.DataFrame) -> go.Figure:
         """
+        Calendar heatmap of the money moved: day of week (rows) by week of FY (columns).
+
+        Parameters:
+        - df (pl.DataFrame): Daily money moved, one row per payment_date with payment_date_day_of_week,
+          payment_date_week_of_fy, payment_date_calendar_monthname and payment_amount_usd.
         """
-        pdf = df.to_pandas()
-
-        pivot = pdf.pivot_table(
-            index="payment_date_day_of_week",
-            columns="payment_date_week_of_fy",
-            values="payment_amount_usd",
-            aggfunc="sum",
-            fill_value=0
-        )
+        # Row and column of every day: the rank among the days of week and weeks with payments
+        cells = df.select([
+            (pl.col("payment_date_day_of_week").rank("dense") - 1).alias("row"),
+            (pl.col("payment_date_week_of_fy").rank("dense") - 1).alias("col"),
+            pl.col("payment_amount_usd"),
+            pl.col("payment_date").cast(pl.Datetime("ms")),
+        ])
+        days_of_week = df["payment_date_day_of_week"].unique().sort()
+        weeks_of_fy = df["payment_date_week_of_fy"].unique().sort()
+        rows, cols = cells["row"].to_numpy(), cells["col"].to_numpy()
 
-        # Create a second pivot table containing the date for each cell.
-        # We use the first (or only) payment_date for that cell.
-        pivot_date = pdf.pivot_table(
-            index="payment_date_day_of_week",
-            columns="payment_date_week_of_fy",
-            values="payment_date",
-            aggfunc='first',
-            fill_value="",
-        )
+        z = np.zeros((len(days_of_week), len(weeks_of_fy)))
+        np.add.at(z, (rows, cols), cells["payment_amount_usd"].to_numpy())
+
+        # The date of each cell, for the hover (a day of week in a week of FY is a single date). Sent as datetimes
+        # like the pandas pivot did, so the customdata keeps the ISO datetime format
+        dates = np.full((len(days_of_week), len(weeks_of_fy)), np.datetime64("NaT"), dtype = "datetime64[ms]")
+        dates[rows, cols] = cells["payment_date"].to_numpy()
 
         heatmap = go.Heatmap(
-            x=pivot.columns,
-            y=pivot.index,
-            z=pivot.values,
+            x=weeks_of_fy.to_numpy(),
+            y=days_of_week.to_numpy(),
+            z=z,
             colorscale=self.custom_colorscale,
-            customdata=pivot_date.values,
+            customdata=dates,
             hovertemplate=(
                 "%{customdata|%b %d, %Y}<br>" +
                 # "Week: %{x}<br>" +
@@ -506,26 +568,37 @@ class Figure:
 
         return fig
     
-    def create_mm_monthly_trendline(self, money_moved_lf, selected_amount_type, selected_drilldown_by):
+    @timed("figure")
+    def create_mm_monthly_trendline(self, money_moved_lf, selected_amount_type, selected_drilldown_by, max_traces = 10):
+        """
+        Monthly money moved, one line per drilldown value if a drilldown is selected.
+
+        Parameters:
+        - money_moved_lf (pl.LazyFrame): Payments, the rollup cube or its monthly aggregate of the selected FY.
+        - selected_amount_type (str): Amount column, payment_amount_usd or payment_cf_amount_usd.
+        - selected_drilldown_by (str): Drilldown column, or "" for a single line.
+        - max_traces (int): Lines drawn for the largest drilldown values (by FY total), the others are summed up as "Other".
+        """
         fig = go.Figure()
         if selected_drilldown_by:
-            lf = (money_moved_lf
+            month_cols = ["payment_date_calendar_month", "payment_date_calendar_monthyear"]
+            monthly_lf = (money_moved_lf
+                .filter(pl.col(selected_drilldown_by).is_not_null())
                 .group_by(["payment_date_fm", selected_drilldown_by])
                 .agg([
                     pl.col(selected_amount_type).sum().alias("money_moved_monthly"),
-                    # pl.col("payment_cf_amount_usd").sum().alias("cf_money_moved_monthly"),
-                    pl.col(["payment_date_calendar_month", "payment_date_calendar_monthyear"]).first(),
+                    pl.col(month_cols).first(),
                 ])
-                .sort("payment_date_fm")
+            )
+            # Values beyond the max_traces largest are bucketed as "Other", one block of months per value in name order
+            lf = data_preparer.top_k_with_other(
+                monthly_lf, selected_drilldown_by, "money_moved_monthly", max_traces, by = ["payment_date_fm"] + month_cols, order = "name"
             )
 
-            unique_traces = data_preparer.get_col_unique_values_lf(lf, selected_drilldown_by)
-
-            df = lf.collect()
-
-            for trace in unique_traces:
-                trace_df = df.filter(pl.col(selected_drilldown_by) == trace).sort("payment_date_fm")
+            with stage("query"):
+                df = lf.collect()
 
+            for trace_df in df.partition_by(selected_drilldown_by, maintain_order = True):
                 fig = fig.add_trace(
                     self.create_line_trace(
                         x_values = trace_df["payment_date_calendar_monthyear"],
@@ -535,7 +608,7 @@ class Figure:
                         marker_color = px.colors.qualitative.Set3,
                         # text_values_list = [f"${val:,.2f}" if val is not None else "" for val in y_vals],
                         text_position = "top left",
-                        name_for_legend = trace,
+                        name_for_legend = trace_df[selected_drilldown_by][0],
                         # legend_group = "Cumulative Donations",
                         # line_color = self.colors['primary'],
                         line_width = 3,
@@ -551,8 +624,9 @@ class Figure:
                     pl.col(["payment_date_calendar_month", "payment_date_calendar_monthyear"]).first(),
                 ])
                 .sort("payment_date_fm")
-                .collect()
             )
+            with stage("query"):
+                df = df.collect()
 
             y_vals = df["money_moved_monthly"].to_list()
 
@@ -610,96 +684,104 @@ class Figure:
         return fig
     
     # Define the Sankey generator function
+    @timed("figure")
     def create_active_pledge_arr_sankey(
         self,
         df: pl.DataFrame,
         view_mode: str = "actual",
         total_target: float = 1000000,  # Replace with your TOTAL_TARGET value
-        top_n_labels: int = 3
+        top_n_labels: int = 3,
+        levels = ("pledge_chapter_type", "pledge_frequency"),
+        max_level_nodes: int = 10,
     ) -> go.Figure:
-        import plotly.graph_objects as go
-        import pandas as pd
-        import collections
+        """
+        Creates a Sankey chart of the active pledge ARR flowing through the levels, left to right, into the Actual ARR
+        node, and in the target view also into a Gap to Target node.
 
-        # Step 1: Aggregate ARR by chapter + frequency
-        grouped = df.group_by(["pledge_chapter_type", "pledge_frequency"]).agg(
-            pl.col("pledge_contribution_arr_usd").sum().alias("actual_arr")
-        ).to_pandas()
+        Parameters:
+        - df (DataFrame): Active pledge ARR aggregate with the level columns and pledge_contribution_arr_usd.
+        - view_mode (str): "actual", or "target" to split the gap to total_target by each path's share of the ARR.
+        - total_target (float): ARR target of the target view.
+        - top_n_labels (int): Number of nodes with the largest flow whose labels show the amount.
+        - levels (sequence of str): Node level columns, e.g. add "pledge_payment_platform" for a third level.
+        - max_level_nodes (int): Nodes per level for the values with the largest ARR, the others are summed up as "Other".
+
+        Returns:
+        - go.Figure: The Sankey chart.
+        """
+        levels = list(levels)
+        sinks = ["Actual ARR"] if view_mode == "actual" else ["Actual ARR", "Gap to Target"]
 
+        # Step 1: Aggregate ARR by path through the levels, with the flow of each path into the sinks
+        paths_lf = df.lazy().select(levels + [pl.col("pledge_contribution_arr_usd").alias("Actual ARR")])
+        for level in levels:
+            paths_lf = data_preparer.top_k_with_other(
+                paths_lf, level, "Actual ARR", max_level_nodes, by = [other for other in levels if other != level], order = "name"
+            )
         if view_mode == "target":
-            total_actual = grouped["actual_arr"].sum()
-            grouped["target_arr"] = (grouped["actual_arr"] / total_actual) * total_target
-            grouped["gap_arr"] = (grouped["target_arr"] - grouped["actual_arr"]).clip(lower=0)
+            paths_lf = paths_lf.with_columns(
+                (pl.col("Actual ARR") / pl.col("Actual ARR").sum() * total_target - pl.col("Actual ARR"))
+                .clip(lower_bound = 0)
+                .alias("Gap to Target")
+            )
+        paths = paths_lf.with_columns(pl.sum_horizontal(sinks).alias("flow")).collect()
+
+        # Step 2: Node index of each path per level. The nodes of a level are its values by flow, largest first, with
+        # "Other" and "Unknown" pinned last like the top_k_with_other order, and the sinks come after the levels.
+        node_names, node_colors, path_nodes = [], [], {}
+        for depth, level in enumerate(levels):
+            level_values = (
+                paths.group_by(level)
+                .agg(pl.col("flow").sum())
+                .sort(
+                    [pl.col(level).replace_strict({"Other": 1, "Unknown": 2}, default = 0, return_dtype = pl.Int8), "flow", level],
+                    descending = [False, True, False],
+                )
+                [level]
+            )
+            node_ids = pl.Series(np.arange(len(level_values), dtype = np.int64) + len(node_names))
+            # The cast keeps the node indexes integers when the FY has no pledges, replace_strict returns an empty column unchanged
+            path_nodes[level] = paths[level].replace_strict(level_values, node_ids).cast(pl.Int64).to_numpy()
+            node_names.extend(level_values.to_list())
+            node_colors.extend([self.sankey_level_colors[depth % len(self.sankey_level_colors)]] * len(level_values))
+
+        sink_nodes = {sink: len(node_names) + i for i, sink in enumerate(sinks)}
+        node_names.extend(sinks)
+        node_colors.extend(self.sankey_sink_colors[sink] for sink in sinks)
+
+        # Step 3: Links between neighbouring levels and from the last level to the sinks, summed over the paths
+        link_frames = [
+            pl.DataFrame({"source": path_nodes[from_level], "target": path_nodes[to_level], "value": paths["flow"]})
+            for from_level, to_level in zip(levels, levels[1:])
+        ] + [
+            pl.DataFrame({"source": path_nodes[levels[-1]], "target": np.full(paths.height, sink_nodes[sink]), "value": paths[sink]})
+            for sink in sinks
+        ]
+        links = (
+            pl.concat(link_frames)
+            .group_by(["source", "target"])
+            .agg(pl.col("value").sum())
+            .filter(pl.col("value") > 0)
+            .sort(["source", "target"])
+        )
+        sources, targets, values = links["source"].to_numpy(), links["target"].to_numpy(), links["value"].to_numpy()
 
-        # Step 2: Build node label list and mappings
-        chapters = grouped["pledge_chapter_type"].unique().tolist()
-        freqs = grouped["pledge_frequency"].unique().tolist()
-        sinks = ["Actual ARR"] if view_mode == "actual" else ["Actual ARR", "Gap to Target"]
-        all_nodes = chapters + freqs + sinks
-        node_idx = {label: idx for idx, label in enumerate(all_nodes)}
-
-        # Step 3: Flow from chapter → frequency
-        sources, targets, values = [], [], []
-        for _, row in grouped.iterrows():
-            ch = row["pledge_chapter_type"]
-            fr = row["pledge_frequency"]
-            actual = row["actual_arr"]
-            flow_value = actual if view_mode == "actual" else actual + row["gap_arr"]
-            sources.append(node_idx[ch])
-            targets.append(node_idx[fr])
-            values.append(flow_value)
-
-        # Step 4: Flow from frequency → sinks
-        flow_to_actual = grouped.groupby("pledge_frequency")["actual_arr"].sum().to_dict()
-        flow_to_gap = {}
-        if view_mode == "target" and "gap_arr" in grouped.columns:
-            flow_to_gap = grouped.groupby("pledge_frequency")["gap_arr"].sum().to_dict()
-
-        for fr in freqs:
-            actual_val = flow_to_actual.get(fr, 0)
-            gap_val = flow_to_gap.get(fr, 0)
-
-            if actual_val > 0:
-                sources.append(node_idx[fr])
-                targets.append(node_idx["Actual ARR"])
-                values.append(actual_val)
-
-            if view_mode == "target" and gap_val > 0:
-                sources.append(node_idx[fr])
-                targets.append(node_idx["Gap to Target"])
-                values.append(gap_val)
-
-        # Step 5: Calculate flow totals for each node
-        node_flow_totals = collections.defaultdict(float)
-        for s, t, v in zip(sources, targets, values):
-            node_flow_totals[s] += v
-            node_flow_totals[t] += v
-
-        # Step 6: Create node labels with embedded value information
-        # This approach works regardless of how Plotly arranges the nodes
-        node_labels = []
-        for i, node in enumerate(all_nodes):
-            # Only add values to the top N nodes by flow
-            flow_value = node_flow_totals[i]
-            if i in [idx for idx, _ in sorted(node_flow_totals.items(), key=lambda x: -x[1])[:top_n_labels]]:
-                # Format the label with value information
-                node_labels.append(f"{node}<br>${flow_value:,.0f}")
-            else:
-                node_labels.append(node)
-        
-        # Step 7: Construct Sankey trace
+        # Step 4: Show the amount in the labels of the top N nodes by flow, a node's flow being its inflow plus its outflow
+        node_flows = (
+            np.bincount(sources, weights = values, minlength = len(node_names))
+            + np.bincount(targets, weights = values, minlength = len(node_names))
+        )
+        node_labels = list(node_names)
+        for i in np.argsort(-node_flows, kind = "stable")[:top_n_labels]:
+            node_labels[i] = f"{node_names[i]}<br>${node_flows[i]:,.0f}"
+
+        # Step 5: Construct Sankey trace
         sankey_trace = go.Sankey(
             node=dict(
                 pad=15,
                 thickness=20,
                 label=node_labels,  # Use our enhanced labels with embedded values
-                color=[
-                    "#006466" if i < len(chapters) else
-                    "#0B525B" if i < len(chapters) + len(freqs) else
-                    "#2D6A4F" if all_nodes[i] == "Actual ARR" else
-                    "#D00000" if all_nodes[i] == "Gap to Target" else
-                    "#ccc" for i in range(len(all_nodes))
-                ],
+                color=node_colors,
                 hovertemplate="<b>%{label}</b><br>Total: $%{value:,.3s}<extra></extra>"
             ),
             link=dict(
@@ -711,10 +793,11 @@ class Figure:
             )
         )
 
-        # Step 8: Create figure and apply layout
+        # Step 6: Create figure and apply layout
+        level_titles = [level.removeprefix("pledge_").replace("_", " ").title() for level in levels]
         fig = go.Figure(data=[sankey_trace])
         fig.update_layout(
-            title_text="Annualized Run Rate Flow : Chapter Type → Frequency → Current ARR",
+            title_text=f"Annualized Run Rate Flow : {' → '.join(level_titles)} → Current ARR",
             font=dict(size=12),
             margin=dict(l=30, r=30, t=40, b=20)
         )
@@ -722,6 +805,7 @@ class Figure:
         return fig
 
 
+    @timed("figure")
     def create_reoccuring_vs_onetime_bar_graph(self, df):
         """
         
@@ -803,6 +887,7 @@ class Figure:
 
         return fig
     
+    @timed("figure")
     def create_dumbell_chart_w_logo(self, df, selected_fy, prior_fy):
 
         df = df.sort_values(by = "pledge_donor_chapter")
@@ -0,0 +1,78 @@
+import functools
+import threading
+from collections import OrderedDict
+
+class FigureCache:
+    """
+    Thread-safe LRU cache of rendered figures, keyed by (chart_id, chart parameters) and bounded by the number of entries.
+
+    Every entry is stored together with the version of the data it was rendered from; a lookup with a different
+    version drops the stale entry and reports a miss.
+
+    A hit returns the cached figure object itself, not a copy, to every caller. Callers must not mutate it
+    (update_layout, add_trace, ...); copy it with go.Figure(figure) before changing it.
+    """
+
+    def __init__(self, max_entries = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (version, figure)
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        Returns the cached figure for the key, or None if it is missing or stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            cached_version, figure = entry
+            if cached_version != version:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return figure
+
+    def put(self, key, version, figure):
+        """
+        Stores the figure and evicts the least recently used entries beyond max_entries.
+        """
+        with self._lock:
+            self._entries[key] = (version, figure)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+    def memoize(self, chart_id, version):
+        """
+        Decorator caching a chart builder: the figure is keyed by the chart id and the builder arguments.
+        The memoized builder returns the shared cached figure, which must not be mutated.
+
+        Parameters:
+        - chart_id (str): Id of the chart the builder renders, e.g. "money-moved-heatmap-graph".
+        - version (callable): Returns the current data version; figures of another version are rebuilt.
+        """
+        def decorator(builder):
+            @functools.wraps(builder)
+            def wrapper(*args):
+                key = (chart_id,) + args
+                current_version = version()
+
+                figure = self.get(key, current_version)
+                if figure is None:
+                    figure = builder(*args)
+                    self.put(key, current_version, figure)
+
+                return figure
+            return wrapper
+        return decorator
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,77 @@
+from pathlib import Path
+import os
+import threading
+import time
+
+class InsightCache:
+    """
+    Content-addressed disk cache of AI insights: one markdown file per key (a hash of the prompt input).
+
+    The files live in a local directory, so every worker process of the app shares the cache. Entries expire after
+    ttl seconds, and the least recently used entries are evicted once the directory grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir, ttl = 24 * 3600, max_bytes = 50 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents = True, exist_ok = True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def get(self, key):
+        """
+        Returns the cached insight for the key, or None if it is missing or expired.
+        """
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime > self.ttl:
+                path.unlink()
+                return None
+
+            with open(path, "r") as f:
+                insight = f.read()
+
+            # The modification time is when the insight was written (TTL), the access time is its last use (LRU)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            return None
+
+        return insight
+
+    def put(self, key, insight):
+        """
+        Stores the insight and evicts the least recently used entries until the cache fits in max_bytes.
+        """
+        # Write to a temporary file and rename it, so other processes never read a partial insight
+        tmp_path = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(insight)
+        os.replace(tmp_path, self._path(key))
+
+        self._evict()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.md"
+
+    def _evict(self):
+        entries = []
+        for path in self.cache_dir.glob("*.md"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        for path in self.cache_dir.glob("*.md"):
+            path.unlink(missing_ok = True)
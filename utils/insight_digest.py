@@ -0,0 +1,91 @@
+"""
+Compact digests of the data behind a chart, sent to the LLM instead of the plotly figure JSON.
+
+A digest is a few "name: value" notes (FY, targets, totals) followed by the chart's source tables as CSV rows.
+It is cut to a token budget by dropping the last rows of the longest tables, so tables should be ordered
+by importance (e.g. top chapters first).
+"""
+import polars as pl
+
+import csv
+import io
+import math
+import os
+
+# Rough token estimate of English text / CSV for the OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("INSIGHT_DIGEST_TOKEN_BUDGET", 600))
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_value(value):
+    """
+    Formats a table cell compactly: amounts without decimals, ratios with two.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.0f}" if abs(value) >= 100 or value.is_integer() else f"{value:.2f}"
+    return str(value)
+
+
+def csv_row(values):
+    """
+    Formats the values as one CSV line, quoting the values which contain commas, quotes or line breaks.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator = "").writerow(values)
+    return buffer.getvalue()
+
+
+def chart_digest(title, tables, notes = None, token_budget = DEFAULT_TOKEN_BUDGET):
+    """
+    Returns the digest text of a chart.
+
+    Parameters:
+    - title (str): Chart title.
+    - tables (dict of str -> DataFrame): Named source tables of the chart.
+    - notes (dict of str -> value): Scalars such as the selected FY, the target or the total.
+    - token_budget (int): Maximum estimated tokens of the digest.
+
+    Returns:
+    - str: The digest.
+    """
+    header = [f"Chart: {title}"] + [f"{name}: {format_value(value)}" for name, value in (notes or {}).items()]
+
+    sections = {}
+    for name, df in tables.items():
+        if isinstance(df, pl.DataFrame):
+            sections[name] = (csv_row(df.columns), [csv_row(format_value(value) for value in row) for row in df.iter_rows()])
+
+    section_rows = {name: list(rows) for name, (_, rows) in sections.items()}
+    dropped_rows = {name: 0 for name in sections}
+
+    def render():
+        lines = list(header)
+        for name, (columns, _) in sections.items():
+            lines.append(f"Table {name}:")
+            lines.append(columns)
+            lines.extend(section_rows[name])
+            if dropped_rows[name]:
+                lines.append(f"... {dropped_rows[name]} more rows")
+        return "\n".join(lines)
+
+    def marker_chars(name):
+        # Length of the "... N more rows" line of a table, with its line break
+        return len(f"\n... {dropped_rows[name]} more rows") if dropped_rows[name] else 0
+
+    # Drop the last rows of the longest table until the digest fits the budget, keeping count of the digest length
+    # instead of rendering it again for every dropped row
+    digest_chars = len(render())
+    while digest_chars > token_budget * CHARS_PER_TOKEN and any(section_rows.values()):
+        longest = max(section_rows, key = lambda name: len(section_rows[name]))
+        digest_chars -= len(section_rows[longest].pop()) + 1 + marker_chars(longest)
+        dropped_rows[longest] += 1
+        digest_chars += marker_chars(longest)
+
+    return render()
@@ -0,0 +1,153 @@
+"""
+Background jobs for AI insights.
+
+Insights take seconds (an OpenAI round trip), so callbacks submit them as jobs and return immediately; a dcc.Interval
+polls the job until it is done. Streaming jobs also publish the partial markdown while they run. Jobs run on a thread pool and their state is kept as one JSON file per job in a local
+directory, so any worker process of the app can poll a job started by another one.
+
+The job directory defaults to <tmp>/oftw-insight-jobs and can be set with INSIGHT_JOB_DIR.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+
+JOB_ERROR_MESSAGE = "LLM could not generate insight."
+
+# Job ids come from the client, only ids in the format of submit are accepted as file names
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+class InsightJobStore:
+    """
+    Runs insight jobs on a thread pool and keeps their state in a disk-backed job store.
+    """
+
+    def __init__(self, job_dir, max_workers = 4, job_timeout = 120, job_ttl = 3600, partial_interval = 0.2):
+        """
+        Parameters:
+        - job_dir (str or Path): Directory of the job files.
+        - max_workers (int): Number of insights generated at the same time.
+        - job_timeout (float): Seconds after which an unfinished job is reported as failed,
+          e.g. when the process running it was restarted.
+        - job_ttl (float): Seconds after which job files are deleted.
+        - partial_interval (float): Minimum seconds between two writes of the partial markdown of a streaming job.
+        """
+        self.job_dir = Path(job_dir)
+        self.job_dir.mkdir(parents = True, exist_ok = True)
+        self.job_timeout = job_timeout
+        self.job_ttl = job_ttl
+        self.partial_interval = partial_interval
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "insight-job")
+
+    def submit(self, chart_id, func, *args, stream = False):
+        """
+        Starts func(*args) in the background and returns the job id. The job result is the markdown returned by func.
+
+        With stream, func is called as func(*args, on_partial = callback) and the markdown passed to the callback
+        is published as the job markdown while the job is running.
+        """
+        job_id = uuid.uuid4().hex
+        self._write(job_id, {"id": job_id, "chart_id": chart_id, "status": JOB_PENDING, "markdown": None, "created_at": time.time()})
+        self._executor.submit(self._run, job_id, func, args, stream)
+        self._cleanup()
+
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns the job state {"id", "chart_id", "status", "markdown", ...}, or None for an unknown or invalid job id.
+        """
+        if not self._is_valid(job_id):
+            return None
+
+        try:
+            with open(self._job_path(job_id), "r") as f:
+                job = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if not isinstance(job, dict) or not {"status", "created_at"} <= job.keys():
+            return None
+
+        if job["status"] in (JOB_PENDING, JOB_RUNNING) and time.time() - job["created_at"] > self.job_timeout:
+            job.update(status = JOB_ERROR, markdown = JOB_ERROR_MESSAGE)
+
+        return job
+
+    def update(self, job_id, **fields):
+        """
+        Updates fields of the job, e.g. the partial markdown of a running job.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return
+
+        job.update(fields, updated_at = time.time())
+        self._write(job_id, job)
+
+    def _run(self, job_id, func, args, stream = False):
+        self.update(job_id, status = JOB_RUNNING)
+        try:
+            if stream:
+                markdown = func(*args, on_partial = self._partial_writer(job_id))
+            else:
+                markdown = func(*args)
+            self.update(job_id, status = JOB_DONE, markdown = markdown)
+        except Exception as e:
+            print(f"Error in insight job {job_id}: {e}")
+            self.update(job_id, status = JOB_ERROR, markdown = JOB_ERROR_MESSAGE)
+
+    def _partial_writer(self, job_id):
+        """
+        Returns the on_partial callback of a streaming job, which writes the partial markdown at most every partial_interval seconds.
+        """
+        last_write = [0.0]
+
+        def on_partial(markdown):
+            now = time.time()
+            if now - last_write[0] >= self.partial_interval:
+                last_write[0] = now
+                self.update(job_id, markdown = markdown)
+
+        return on_partial
+
+    def _is_valid(self, job_id):
+        return isinstance(job_id, str) and JOB_ID_PATTERN.fullmatch(job_id) is not None
+
+    def _job_path(self, job_id):
+        return self.job_dir / f"{job_id}.json"
+
+    def _write(self, job_id, job):
+        # Write to a temporary file and rename it, so pollers never read a partial file
+        tmp_path = self.job_dir / f"{job_id}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._job_path(job_id))
+
+    def _cleanup(self):
+        """
+        Deletes the job files older than job_ttl.
+        """
+        expired_before = time.time() - self.job_ttl
+        for job_path in self.job_dir.glob("*.json"):
+            try:
+                if job_path.stat().st_mtime < expired_before:
+                    job_path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+insight_jobs = InsightJobStore(
+    job_dir = os.getenv("INSIGHT_JOB_DIR", Path(tempfile.gettempdir()) / "oftw-insight-jobs"),
+    max_workers = int(os.getenv("INSIGHT_JOB_WORKERS", 4)),
+)
@@ -0,0 +1,137 @@
+"""
+Server-side store of the AI insights shown in the insight panel, one bounded ring buffer per browser session.
+
+The client only holds its session id and a version number of its messages, so callback payloads stay the same size
+however many insights a session asks for. Like the job store, the buffers are JSON files in a local directory
+shared by every worker process of the app.
+
+The directory defaults to <tmp>/oftw-insight-messages and can be set with INSIGHT_MESSAGE_DIR.
+
+Changes of a session are serialized across the worker processes with an fcntl lock on a <session id>.lock file.
+Without fcntl (Windows) they are only serialized within one process, so run a single worker process there.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Session ids come from the client, only ids in the format of new_session_id are accepted as file names
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+class InsightMessageStore:
+    """
+    Keeps the latest max_messages insights of each session, newest first, with a version number bumped on every change.
+    """
+
+    def __init__(self, store_dir, max_messages = 20, session_ttl = 24 * 3600):
+        """
+        Parameters:
+        - store_dir (str or Path): Directory of the session files.
+        - max_messages (int): Number of insights kept per session, older insights are dropped.
+        - session_ttl (float): Seconds after the last change of a session when its file is deleted.
+        """
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents = True, exist_ok = True)
+        self.max_messages = max_messages
+        self.session_ttl = session_ttl
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id():
+        return uuid.uuid4().hex
+
+    def get(self, session_id):
+        """
+        Returns (version, messages) of the session, (0, []) for an unknown or invalid session id.
+        """
+        if not self._is_valid(session_id):
+            return 0, []
+
+        try:
+            with open(self._session_path(session_id), "r") as f:
+                session = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0, []
+
+        return session["version"], session["messages"]
+
+    def prepend(self, session_id, messages):
+        """
+        Adds the messages in front of the session's messages (the first one becomes the newest) and returns the new version.
+        """
+        if not self._is_valid(session_id):
+            return 0
+
+        with self._session_lock(session_id):
+            version, existing_messages = self.get(session_id)
+            session = {
+                "version": version + 1,
+                "messages": (list(messages) + existing_messages)[:self.max_messages],
+            }
+            self._write(session_id, session)
+
+        self._cleanup()
+
+        return session["version"]
+
+    def _is_valid(self, session_id):
+        return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+    def _session_path(self, session_id):
+        return self.store_dir / f"{session_id}.json"
+
+    def _lock_path(self, session_id):
+        return self.store_dir / f"{session_id}.lock"
+
+    @contextmanager
+    def _session_lock(self, session_id):
+        """
+        Holds the lock of the session for a read-modify-write, shared by the threads and processes using store_dir.
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+
+            with open(self._lock_path(session_id), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, session_id, session):
+        # Write to a temporary file and rename it, so readers never see a partial file
+        tmp_path = self.store_dir / f"{session_id}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(session, f)
+        os.replace(tmp_path, self._session_path(session_id))
+
+    def _cleanup(self):
+        """
+        Deletes the session files (and their lock files) not changed for session_ttl.
+        """
+        expired_before = time.time() - self.session_ttl
+        for session_path in self.store_dir.glob("*.json"):
+            try:
+                if session_path.stat().st_mtime < expired_before:
+                    session_path.unlink()
+                    session_path.with_suffix(".lock").unlink(missing_ok = True)
+            except FileNotFoundError:
+                pass
+
+
+insight_messages = InsightMessageStore(
+    store_dir = os.getenv("INSIGHT_MESSAGE_DIR", Path(tempfile.gettempdir()) / "oftw-insight-messages"),
+    max_messages = int(os.getenv("INSIGHT_MESSAGE_MAX", 20)),
+)
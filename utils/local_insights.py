@@ -0,0 +1,314 @@
+"""
+Deterministic, offline insights computed from the aggregates behind each chart.
+
+They are rendered in the same Summary / Key Insights / Action Suggestions markdown as the LLM insights, in milliseconds
+and without network access. The page uses them when INSIGHT_ENGINE=local and as the fallback when OpenAI fails.
+"""
+import polars as pl
+
+
+def format_usd(value, signed = False):
+    """
+    Formats an amount as $1.2M, $78K or $950 (-$950 for negative amounts, +$950 with signed).
+    """
+    sign = "-" if value < 0 else ("+" if signed else "")
+    value = abs(value)
+    if value >= 1_000_000:
+        return f"{sign}${value / 1_000_000:,.1f}M"
+    if value >= 1_000:
+        return f"{sign}${value / 1_000:,.0f}K"
+    return f"{sign}${value:,.0f}"
+
+
+def format_change(change):
+    return f"{change:+.0%}" if change is not None else "n/a"
+
+
+class LocalInsightEngine:
+    """
+    Statistical insights per chart. Every method takes the chart's insight tables (polars DataFrames) and returns markdown.
+    """
+
+    def render_markdown(self, summary, key_insights, action_suggestions):
+        """
+        Returns the insight in the markdown format of the LLM prompt.
+        """
+        lines = [f"1. Summary: {summary}", "2. Key Insights:"]
+        lines += [f"   - {insight}" for insight in key_insights]
+        lines.append("3. Action Suggestions:")
+        lines += [f"   - {suggestion}" for suggestion in action_suggestions]
+
+        return "\n".join(lines)
+
+    def get_month_stats(self, df, label_col, value_col):
+        """
+        Returns the best and worst month and the largest month-over-month rise and drop of a monthly series.
+
+        Returns:
+        - dict: best_month, best_value, worst_month, worst_value, rise_month, rise, drop_month, drop
+          (the rise and drop are relative changes to the prior month, None with less than two months).
+        """
+        df = df.select([
+            pl.col(label_col).cast(pl.String).alias("label"),
+            pl.col(value_col).fill_null(0).alias("value"),
+        ]).with_columns(
+            (pl.col("value") / pl.col("value").shift(1) - 1).alias("mom_change")
+        )
+
+        stats = df.select([
+            pl.col("label").get(pl.col("value").arg_max()).alias("best_month"),
+            pl.col("value").max().alias("best_value"),
+            pl.col("label").get(pl.col("value").arg_min()).alias("worst_month"),
+            pl.col("value").min().alias("worst_value"),
+        ]).row(0, named = True)
+
+        # Only finite changes (a month after a month without money has no relative change)
+        changes = df.filter(pl.col("mom_change").is_finite())
+        if changes.is_empty():
+            stats.update(rise_month = None, rise = None, drop_month = None, drop = None)
+        else:
+            stats.update(changes.select([
+                pl.col("label").get(pl.col("mom_change").arg_max()).alias("rise_month"),
+                pl.col("mom_change").max().alias("rise"),
+                pl.col("label").get(pl.col("mom_change").arg_min()).alias("drop_month"),
+                pl.col("mom_change").min().alias("drop"),
+            ]).row(0, named = True))
+
+        return stats
+
+    def month_insights(self, stats):
+        insights = [
+            f"{stats['best_month']} was the strongest month ({format_usd(stats['best_value'])}) and "
+            f"{stats['worst_month']} the weakest ({format_usd(stats['worst_value'])})."
+        ]
+        if stats["rise"] is not None:
+            insights.append(
+                f"The largest month-over-month rise was {format_change(stats['rise'])} in {stats['rise_month']}, "
+                f"the largest drop {format_change(stats['drop'])} in {stats['drop_month']}."
+            )
+        return insights
+
+    def cumulative_insight(self, monthly_df, target, months_in_fy = 12):
+        """
+        Parameters:
+        - monthly_df (DataFrame): month, money_moved, cumulative, in fiscal month order.
+        - target (float): FY fund raise target.
+        """
+        if monthly_df.is_empty():
+            return self.empty_insight("money moved")
+
+        months = monthly_df.height
+        total = monthly_df["cumulative"][-1]
+        pace = target * months / months_in_fy
+        projected = total / months * months_in_fy
+        stats = self.get_month_stats(monthly_df, "month", "money_moved")
+
+        summary = (
+            f"Cumulative money moved reached {format_usd(total)} after {months} fiscal months, "
+            f"{total / target:.0%} of the {format_usd(target)} target."
+        )
+        key_insights = [
+            f"That is {'ahead of' if total >= pace else 'behind'} the linear pace to the target "
+            f"({format_usd(pace)} by now) by {format_usd(abs(total - pace))}; at this rate the FY ends at {format_usd(projected)}.",
+        ] + self.month_insights(stats)
+
+        remaining_months = months_in_fy - months
+        if total >= target:
+            action_suggestions = ["The target is met: set a stretch goal for the rest of the FY."]
+        elif remaining_months > 0:
+            action_suggestions = [
+                f"Raise about {format_usd((target - total) / remaining_months)} per remaining month to close the "
+                f"{format_usd(target - total)} gap."
+            ]
+        else:
+            action_suggestions = [f"The FY closed {format_usd(target - total)} short of the target: review the target for next FY."]
+        action_suggestions.append(
+            f"Plan campaigns around {stats['best_month']} and review what drove the dip in {stats['worst_month']}."
+        )
+
+        return self.render_markdown(summary, key_insights, action_suggestions)
+
+    def reoccuring_insight(self, monthly_df):
+        """
+        Parameters:
+        - monthly_df (DataFrame): month and one amount column per frequency type (One-Time, Recurring, ...).
+        """
+        type_cols = [col for col in monthly_df.columns if col != "month"]
+        if monthly_df.is_empty() or "Recurring" not in type_cols:
+            return self.empty_insight("recurring money moved")
+
+        df = monthly_df.fill_null(0).with_columns(
+            (pl.col("Recurring") / pl.sum_horizontal(type_cols)).alias("recurring_share")
+        )
+        totals = df.select(type_cols).sum().row(0, named = True)
+        total = sum(totals.values())
+        recurring_share = totals["Recurring"] / total if total else 0
+        first_share, last_share = df["recurring_share"][0], df["recurring_share"][-1]
+
+        summary = f"Recurring donations made up {recurring_share:.0%} of the {format_usd(total)} money moved this FY."
+        key_insights = [
+            f"The recurring share went from {first_share:.0%} in {df['month'][0]} to {last_share:.0%} in {df['month'][-1]}.",
+        ]
+        if "One-Time" in type_cols:
+            peak = df.row(df["One-Time"].arg_max(), named = True)
+            key_insights.append(
+                f"One-time giving peaked in {peak['month']} at {format_usd(peak['One-Time'])}, "
+                f"{totals['One-Time'] / total if total else 0:.0%} of the FY total."
+            )
+
+        action_suggestions = [
+            "Convert one-time donors from the peak months into recurring pledges."
+            if last_share < first_share else
+            "Keep investing in recurring pledges, they are a growing and predictable base.",
+            "Follow up with recurring donors whose payments stopped, to protect the recurring base.",
+        ]
+
+        return self.render_markdown(summary, key_insights, action_suggestions)
+
+    def chapter_insight(self, chapters_df, selected_fy, prior_fy):
+        """
+        Parameters:
+        - chapters_df (DataFrame): chapter, <selected_fy>, <prior_fy>, change, top chapters first (may include Other and Unknown).
+        """
+        named_df = chapters_df.filter(~pl.col("chapter").is_in(["Other", "Unknown"]))
+        if named_df.is_empty():
+            return self.empty_insight("donor chapter")
+
+        selected_total = chapters_df[selected_fy].sum()
+        prior_total = chapters_df[prior_fy].sum()
+        gainer = named_df.row(named_df["change"].arg_max(), named = True)
+        decliner = named_df.row(named_df["change"].arg_min(), named = True)
+        growing = named_df.filter(pl.col("change") > 0).height
+
+        summary = (
+            f"The top donor chapters moved {format_usd(selected_total)} in {selected_fy} vs {format_usd(prior_total)} in {prior_fy} "
+            f"({format_change(selected_total / prior_total - 1 if prior_total else None)})."
+        )
+        key_insights = [
+            f"Best change: {gainer['chapter']} ({format_usd(gainer['change'], signed = True)}); "
+            f"worst change: {decliner['chapter']} ({format_usd(decliner['change'], signed = True)}).",
+            f"{growing} of {named_df.height} named chapters grew year over year.",
+        ]
+        action_suggestions = [
+            f"Reach out to {decliner['chapter']} to understand the decline."
+            if decliner["change"] < 0 else
+            f"Recognise {decliner['chapter']}, even the smallest change among the top chapters is growth.",
+            f"Share what worked at {gainer['chapter']} with the other chapters."
+            if gainer["change"] > 0 else
+            "Every top chapter declined: review the chapter engagement plan with the chapter leads.",
+        ]
+
+        return self.render_markdown(summary, key_insights, action_suggestions)
+
+    def heatmap_insight(self, weekday_df, month_df, top_days_df):
+        """
+        Parameters:
+        - weekday_df (DataFrame): weekday, money_moved.
+        - month_df (DataFrame): month, money_moved, days_with_payments, in fiscal month order.
+        - top_days_df (DataFrame): payment_date, money_moved, largest first.
+        """
+        total = weekday_df["money_moved"].sum()
+        if not total:
+            return self.empty_insight("daily money moved")
+
+        best_weekday = weekday_df.row(weekday_df["money_moved"].arg_max(), named = True)
+        weekend = weekday_df.filter(pl.col("weekday").is_in(["Sat", "Sun"]))["money_moved"].sum()
+        top_day = top_days_df.row(0, named = True)
+        stats = self.get_month_stats(month_df, "month", "money_moved")
+
+        summary = f"{format_usd(total)} moved this FY; {best_weekday['weekday']} is the busiest weekday."
+        key_insights = [
+            f"{best_weekday['weekday']} brings {best_weekday['money_moved'] / total:.0%} of the money, weekends {weekend / total:.0%}.",
+            f"The single largest day was {top_day['payment_date']} with {format_usd(top_day['money_moved'])} "
+            f"({top_day['money_moved'] / total:.0%} of the FY); the top {top_days_df.height} days make up "
+            f"{top_days_df['money_moved'].sum() / total:.0%}.",
+        ] + self.month_insights(stats)[:1]
+        action_suggestions = [
+            f"Time donation asks and reminders for {best_weekday['weekday']}.",
+            f"Look into what drove {top_day['payment_date']} and plan similar moments.",
+        ]
+
+        return self.render_markdown(summary, key_insights, action_suggestions)
+
+    def trendline_insight(self, monthly_df, drilldown_col = None):
+        """
+        Parameters:
+        - monthly_df (DataFrame): month, money_moved without drilldown; with drilldown one row per drilldown value
+          (largest first) with one column per month and a total.
+        - drilldown_col (str): Drilldown column, or None.
+        """
+        if monthly_df.is_empty():
+            return self.empty_insight("monthly money moved")
+
+        if not drilldown_col:
+            stats = self.get_month_stats(monthly_df, "month", "money_moved")
+            summary = f"Monthly money moved ranged from {format_usd(stats['worst_value'])} to {format_usd(stats['best_value'])}."
+            action_suggestions = [
+                f"Plan campaigns around {stats['best_month']}, the strongest month.",
+                "Drill down by chapter or platform to see which segments drive the swings.",
+            ]
+            return self.render_markdown(summary, self.month_insights(stats), action_suggestions)
+
+        month_cols = [col for col in monthly_df.columns if col not in (drilldown_col, "total")]
+        drilldown_label = drilldown_col.removeprefix("pledge_").removeprefix("payment_").replace("_", " ")
+        total = monthly_df["total"].sum()
+        top = monthly_df.row(0, named = True)
+        movers = monthly_df.with_columns(
+            (pl.col(month_cols[-1]) - pl.col(month_cols[0])).alias("first_to_last")
+        )
+        riser = movers.row(movers["first_to_last"].arg_max(), named = True)
+        faller = movers.row(movers["first_to_last"].arg_min(), named = True)
+        top3_share = monthly_df["total"].head(3).sum() / total if total else 0
+
+        summary = f"Money moved by {monthly_df.height} {drilldown_label} values adds up to {format_usd(total)}; {top[drilldown_col]} leads with {top['total'] / total if total else 0:.0%}."
+        key_insights = [
+            f"The top 3 make up {top3_share:.0%} of the total.",
+            f"From {month_cols[0]} to {month_cols[-1]}, {riser[drilldown_col]} grew the most "
+            f"({format_usd(riser['first_to_last'], signed = True)}) and {faller[drilldown_col]} fell the most ({format_usd(faller['first_to_last'], signed = True)}).",
+        ]
+        action_suggestions = [
+            f"Check in with {faller[drilldown_col]} about the decline.",
+            "Reduce the dependence on the top values by growing the mid-sized ones." if top3_share > 0.5 else
+            f"Replicate the growth of {riser[drilldown_col]} in similar segments.",
+        ]
+
+        return self.render_markdown(summary, key_insights, action_suggestions)
+
+    def sankey_insight(self, arr_df, target = None):
+        """
+        Parameters:
+        - arr_df (DataFrame): pledge_chapter_type, pledge_frequency, arr, pledges, largest flow first.
+        - target (float): ARR target, or None.
+        """
+        total = arr_df["arr"].sum()
+        if not total:
+            return self.empty_insight("active pledge ARR")
+
+        by_chapter_type = arr_df.group_by("pledge_chapter_type").agg(pl.col("arr").sum()).sort("arr", descending = True)
+        monthly = arr_df.filter(pl.col("pledge_frequency") == "Monthly")["arr"].sum()
+        top_flow = arr_df.row(arr_df["arr"].arg_max(), named = True)
+        top_chapter_type = by_chapter_type.row(0, named = True)
+
+        summary = f"Active pledges add up to {format_usd(total)} ARR across {arr_df['pledges'].sum()} pledges."
+        key_insights = [
+            f"{top_chapter_type['pledge_chapter_type']} chapters bring {top_chapter_type['arr'] / total:.0%} of the ARR; "
+            f"the largest flow is {top_flow['pledge_chapter_type']} / {top_flow['pledge_frequency']} ({format_usd(top_flow['arr'])}).",
+            f"Monthly pledges make up {monthly / total:.0%} of the ARR.",
+        ]
+        action_suggestions = [
+            f"Grow the chapter types beyond {top_chapter_type['pledge_chapter_type']} to diversify the ARR.",
+        ]
+        if target:
+            key_insights.append(f"The ARR is {total / target:.0%} of the {format_usd(target)} target.")
+            if total < target:
+                action_suggestions.append(f"{format_usd(target - total)} of ARR is missing: prioritise new monthly pledges.")
+        else:
+            action_suggestions.append("Encourage annual and quarterly donors to switch to monthly pledges.")
+
+        return self.render_markdown(summary, key_insights, action_suggestions)
+
+    def empty_insight(self, subject):
+        return self.render_markdown(f"There is no {subject} data for this selection.", [], [])
+
+
+insight_engine = LocalInsightEngine()
@@ -8,7 +8,7 @@ import re
 import hashlib
 
 # Path to logo folder — adjust if needed
-logo_dir = Path("/home/dhb/dash_oftp/downloaded_logos")
+logo_dir = (Path(__file__)/'..'/'..'/'data'/'downloaded_logos').resolve()
 
 # Cache to avoid re-encoding (in-memory for current session)
 logo_cache = {}
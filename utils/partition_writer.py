@@ -0,0 +1,63 @@
+"""
+Writes a dataset as a hive partitioned directory, e.g. data/merged/payment_date_fy=FY2024-2025/00000000.parquet.
+
+DataLoader reads the partitioned directory instead of the single parquet file when it exists,
+so filters on the partition column skip whole files.
+
+Usage:
+    python -m utils.partition_writer --dataset merged --partition-by payment_date_fy
+"""
+import polars as pl
+
+import argparse
+import os
+import shutil
+
+from utils.data_files import DATA_DIR, parquet_files
+
+
+def write_partitioned(source_path, target_dir, partition_by = "payment_date_fy"):
+    """
+    Writes the parquet file at source_path into a hive partitioned directory.
+    The new directory is written next to the target and renamed into place, so readers never see a partial dataset.
+
+    Parameters:
+    - source_path (str): Parquet file to partition.
+    - target_dir (str): Directory to write, e.g. data/merged.
+    - partition_by (str or list of str): Partition column(s).
+
+    Returns:
+    - list of str: Partition directories which were written.
+    """
+    target_dir = str(target_dir).rstrip(os.sep)
+    tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+    old_dir = f"{target_dir}.old-{os.getpid()}"
+
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+    (pl.read_parquet(source_path)
+        .sort(partition_by, nulls_last = True)
+        .write_parquet(tmp_dir, partition_by = partition_by)
+    )
+
+    if os.path.exists(target_dir):
+        os.replace(target_dir, old_dir)
+    os.replace(tmp_dir, target_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+    return sorted(os.listdir(target_dir))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Write a dataset as a hive partitioned parquet directory.")
+    parser.add_argument("--dataset", default = "merged", choices = sorted(parquet_files.keys()))
+    parser.add_argument("--partition-by", default = "payment_date_fy")
+    args = parser.parse_args()
+
+    source_path = DATA_DIR / parquet_files[args.dataset]
+    target_dir = DATA_DIR / source_path.stem
+
+    partitions = write_partitioned(source_path, target_dir, args.partition_by)
+    print(f"Wrote {len(partitions)} partitions of {source_path.name} to {target_dir}")
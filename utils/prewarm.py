@@ -0,0 +1,141 @@
+"""
+Pre-warming of the page caches at app start.
+
+Pages register warm-up tasks with prewarmer.register(), e.g. building every chart of every FY with the default control
+values. init_app(server) runs them on a thread pool in the background, so the result cache and the figure cache are
+filled before the first user selects a FY, and adds a /ready route for readiness probes: HTTP 200 once every task
+finished, 503 while the warm-up is running.
+
+The caches are per process, so the warm-up starts on the first request of each process (usually the first /ready
+probe) rather than at import. Forking the app after it was created (gunicorn --preload) is not supported: the data
+is loaded with Polars at import, and Polars queries of a forked process can hang, so /ready would never answer 200.
+Run gunicorn without --preload, every worker then imports the app and warms its own caches.
+
+PREWARM_WORKERS sets the pool size (default 4); PREWARM=0 turns the warm-up off (the app is ready at once).
+"""
+import flask
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+# Process which imported the app, a warm-up started in another process runs in a fork of it
+_import_pid = os.getpid()
+
+class Prewarmer:
+    """
+    Runs the registered warm-up tasks on a thread pool and tracks their progress.
+    """
+
+    def __init__(self, max_workers = 4):
+        self.max_workers = max_workers
+        self.tasks = []            # (name, func, args), run in registration order
+        self.done = 0
+        self.failed = []
+        self.started_at = None
+        self.finished_at = None
+        self._started_pid = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def register(self, name, func, *args):
+        """
+        Adds a warm-up task calling func(*args). Register the most used views first, they are warmed first.
+        """
+        self.tasks.append((name, func, args))
+
+    def start(self):
+        """
+        Starts the warm-up in the background and returns immediately.
+        """
+        self.started_at = time.perf_counter()
+        if not self.tasks:
+            self._finish()
+            return
+
+        executor = ThreadPoolExecutor(max_workers = self.max_workers, thread_name_prefix = "prewarm")
+        for name, func, args in self.tasks:
+            executor.submit(self._run, name, func, args)
+        executor.shutdown(wait = False)
+
+    def ensure_started(self):
+        """
+        Starts the warm-up unless it was already started in this process. A forked process starts its own warm-up,
+        the progress inherited from the parent process does not belong to its caches.
+        """
+        if self._started_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            if os.getpid() != _import_pid:
+                print("Warning: the app was forked after loading the data (gunicorn --preload?), its Polars queries can hang. Start it without --preload.")
+            self._started_pid = os.getpid()
+            self.done = 0
+            self.failed = []
+            self.finished_at = None
+            self._ready = threading.Event()
+
+        self.start()
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout = None):
+        """
+        Blocks until the warm-up finished (or the timeout passed) and returns whether it finished.
+        """
+        return self._ready.wait(timeout)
+
+    def status(self):
+        end = self.finished_at or time.perf_counter()
+        return {
+            "ready": self.is_ready(),
+            "done": self.done,
+            "total": len(self.tasks),
+            "failed": [name for name, _ in self.failed],
+            "seconds": round(end - self.started_at, 2) if self.started_at else None,
+        }
+
+    def _run(self, name, func, args):
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"Error in warm-up task {name}: {e}")
+            with self._lock:
+                self.failed.append((name, e))
+
+        with self._lock:
+            self.done += 1
+            if self.done == len(self.tasks):
+                self._finish()
+
+    def _finish(self):
+        self.finished_at = time.perf_counter()
+        self._ready.set()
+        print(f"Warm-up finished: {len(self.tasks)} tasks in {self.finished_at - self.started_at:.1f} s, {len(self.failed)} failed")
+
+
+prewarmer = Prewarmer(max_workers = int(os.getenv("PREWARM_WORKERS", 4)))
+
+
+def init_app(server):
+    """
+    Adds the /ready route to the Flask server and starts the warm-up of the registered tasks on the first request.
+
+    Parameters:
+    - server (flask.Flask): The Dash app server.
+    """
+    if os.getenv("PREWARM", "1") == "0":
+        prewarmer.tasks = []
+
+    @server.before_request
+    def start_prewarm():
+        prewarmer.ensure_started()
+
+    @server.route("/ready")
+    def ready():
+        status = prewarmer.status()
+        return flask.jsonify(status), 200 if status["ready"] else 503
@@ -0,0 +1,63 @@
+import polars as pl
+
+import threading
+from collections import OrderedDict
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of collected Polars DataFrames, bounded by their total estimated size.
+
+    Every entry is stored together with the version (fingerprint) of the source it was computed
+    from; a lookup with a different version drops the stale entry and reports a miss.
+    """
+
+    def __init__(self, max_bytes = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()   # key -> (version, DataFrame, size in bytes)
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        Returns the cached DataFrame for the key, or None if it is missing or stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            cached_version, frame, size = entry
+            if cached_version != version:
+                del self._entries[key]
+                self.total_bytes -= size
+                return None
+
+            self._entries.move_to_end(key)
+            return frame
+
+    def put(self, key, version, frame: pl.DataFrame):
+        """
+        Stores the DataFrame and evicts the least recently used entries until the cache fits in max_bytes.
+        """
+        size = frame.estimated_size()
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[2]
+
+            self._entries[key] = (version, frame, size)
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last = False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
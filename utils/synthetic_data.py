@@ -0,0 +1,226 @@
+"""
+Generates a synthetic copy of the OFTW datasets (merged, pledges, payments, pledge_active_arr) at a configurable scale,
+for load and performance testing.
+
+The shipped data is used as the distribution: every copy k of it gets its own pledge, donor and payment ids and has its
+dates and amounts jittered, so chapters, chapter types, platforms, frequency types, portfolios and the FY / fiscal month
+mix stay those of the real data. Copy 0 is the shipped data itself; a fractional scale keeps a share of the pledges of
+the last copy. The jitter is derived from the ids, so a payment gets the same date and amount in merged and payments.
+
+Point DataLoader at the output directory with the OFTW_DATA_DIR environment variable.
+
+Usage:
+    python -m utils.synthetic_data --scale 10 --out /tmp/oftw-x10
+    OFTW_DATA_DIR=/tmp/oftw-x10 python app.py
+"""
+import polars as pl
+
+import argparse
+import math
+import os
+
+from utils.data_files import DATA_DIR, parquet_files
+
+MAX_DATE_JITTER_DAYS = 14
+MAX_AMOUNT_JITTER = 0.1
+
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def _copy_hash(id_col, copy, seed, salt):
+    """
+    Returns a deterministic UInt64 hash of an id column within one copy of the data.
+    """
+    return pl.concat_str([pl.col(id_col).fill_null(""), pl.lit(f"#{copy}#{salt}")]).hash(seed = seed)
+
+
+def _unit_jitter(id_col, copy, seed, salt):
+    """
+    Returns a deterministic value in [-1, 1) per id.
+    """
+    return (_copy_hash(id_col, copy, seed, salt) % 1_000_000).cast(pl.Float64) / 500_000 - 1
+
+
+def _keep_rows(id_col, copy, seed, fraction):
+    """
+    Returns a boolean expression keeping about fraction of the ids of a copy. Rows with the same id are kept together.
+    """
+    if fraction >= 1:
+        return pl.lit(True)
+    return (_copy_hash(id_col, copy, seed, "keep") % 1_000_000) < int(fraction * 1_000_000)
+
+
+def _suffix_ids(columns, copy):
+    """
+    Returns expressions giving the id columns of copy k a unique suffix. Copy 0 keeps the original ids.
+    """
+    if copy == 0:
+        return []
+    return [
+        pl.when(pl.col(col_name).is_null() | (pl.col(col_name) == ""))
+            .then(pl.col(col_name))
+            .otherwise(pl.col(col_name) + f"-s{copy}")
+            .alias(col_name)
+        for col_name in columns
+    ]
+
+
+def _shift_dates(columns, id_col, copy, seed):
+    """
+    Returns expressions shifting the date columns of one row by the same number of days (up to MAX_DATE_JITTER_DAYS).
+    """
+    if copy == 0:
+        return []
+    days = (_unit_jitter(id_col, copy, seed, "date") * MAX_DATE_JITTER_DAYS).round().cast(pl.Int64)
+    return [(pl.col(col_name) + pl.duration(days = days)).alias(col_name) for col_name in columns]
+
+
+def _scale_amounts(columns, id_col, copy, seed):
+    """
+    Returns expressions multiplying the amount columns of one row by the same factor (up to +/- MAX_AMOUNT_JITTER).
+    """
+    if copy == 0:
+        return []
+    factor = 1 + _unit_jitter(id_col, copy, seed, "amount") * MAX_AMOUNT_JITTER
+    return [(pl.col(col_name) * factor).round(2).alias(col_name) for col_name in columns]
+
+
+def payment_date_columns(date_col = "payment_date"):
+    """
+    Returns the expressions deriving the calendar and fiscal year columns of merged from the payment date.
+    The fiscal year starts on July 1st, e.g. 2024-08-15 is in FY2024-2025, fiscal month 2.
+    """
+    date = pl.col(date_col)
+    fy_start_year = pl.when(date.dt.month() >= 7).then(date.dt.year()).otherwise(date.dt.year() - 1)
+    fy_start = pl.date(fy_start_year, 7, 1)
+    month_name = date.dt.month().replace_strict(list(range(1, 13)), MONTH_NAMES, return_dtype = pl.String)
+
+    return [
+        date.dt.year().alias("payment_date_calendar_year"),
+        date.dt.month().alias("payment_date_calendar_month"),
+        month_name.alias("payment_date_calendar_monthname"),
+        pl.concat_str([month_name, pl.lit("'"), date.dt.strftime("%y")]).alias("payment_date_calendar_monthyear"),
+        pl.concat_str([pl.lit("FY"), fy_start_year.cast(pl.String), pl.lit("-"), (fy_start_year + 1).cast(pl.String)]).alias("payment_date_fy"),
+        ((date.dt.month() + 5) % 12 + 1).alias("payment_date_fm"),
+        ((date.dt.day() - 1) // 7 + 1).alias("payment_date_week_of_month"),
+        date.dt.weekday().alias("payment_date_day_of_week"),
+        date.dt.week().alias("payment_date_week_of_year"),
+        ((date - fy_start).dt.total_days() // 7 + 1).alias("payment_date_week_of_fy"),
+    ]
+
+
+def _copies(scale):
+    """
+    Returns (copy, fraction of pledges kept) for every copy of the data needed for the scale.
+    """
+    n_copies = max(1, math.ceil(scale))
+    return [(copy, min(1.0, scale - copy)) for copy in range(n_copies)]
+
+
+def _generate_pledges(df, scale, seed):
+    frames = []
+    for copy, fraction in _copies(scale):
+        frames.append(df
+            .filter(_keep_rows("pledge_id", copy, seed, fraction))
+            .with_columns(_shift_dates(["pledge_created_at", "pledge_starts_at", "pledge_ended_at"], "pledge_id", copy, seed))
+            .with_columns(_scale_amounts(["pledge_contribution_amount", "pledge_contribution_amount_usd"], "pledge_id", copy, seed))
+            .with_columns(_suffix_ids(["pledge_id", "pledge_donor_id"], copy))
+        )
+    return pl.concat(frames)
+
+
+def _generate_payments(df, scale, seed, date_range):
+    frames = []
+    for copy, fraction in _copies(scale):
+        frames.append(df
+            .filter(pl.when(pl.col("payment_pledge_id").is_not_null())
+                .then(_keep_rows("payment_pledge_id", copy, seed, fraction))
+                .otherwise(_keep_rows("payment_id", copy, seed, fraction)))
+            .with_columns(_shift_dates(["payment_date"], "payment_id", copy, seed))
+            .with_columns(pl.col("payment_date").clip(*date_range))
+            .with_columns(_scale_amounts(["payment_amount", "payment_amount_usd"], "payment_id", copy, seed))
+            .with_columns((pl.col("payment_amount_usd") * pl.col("payment_counterfactuality")).alias("payment_cf_amount_usd"))
+            .with_columns(_suffix_ids(["payment_id", "payment_pledge_id", "payment_donor_id"], copy))
+        )
+    return pl.concat(frames)
+
+
+def _generate_merged(df, scale, seed, date_range):
+    frames = []
+    for copy, fraction in _copies(scale):
+        frames.append(df
+            .filter(pl.when(pl.col("pledge_id").is_not_null())
+                .then(_keep_rows("pledge_id", copy, seed, fraction))
+                .otherwise(_keep_rows("payment_id", copy, seed, fraction)))
+            .with_columns(_shift_dates(["pledge_created_at", "pledge_starts_at", "pledge_ended_at"], "pledge_id", copy, seed))
+            .with_columns(_scale_amounts(["pledge_contribution_amount", "pledge_contribution_amount_usd"], "pledge_id", copy, seed))
+            .with_columns(_shift_dates(["payment_date"], "payment_id", copy, seed))
+            .with_columns(pl.col("payment_date").clip(*date_range))
+            .with_columns(_scale_amounts(["payment_amount", "payment_amount_usd"], "payment_id", copy, seed))
+            .with_columns((pl.col("payment_amount_usd") * pl.col("payment_counterfactuality")).alias("payment_cf_amount_usd"))
+            .with_columns(payment_date_columns() if copy > 0 else [])
+            .with_columns(_suffix_ids(["pledge_id", "pledge_donor_id", "payment_id", "payment_pledge_id", "payment_donor_id"], copy))
+            .cast(df.schema)
+        )
+    return pl.concat(frames)
+
+
+def _generate_pledge_active_arr(df, scale):
+    # One row per dimension combination: the row count is bound by the dimensions, only the counts and ARR scale
+    pledge_count = (pl.col("pledge_count") * scale).round().clip(lower_bound = 1)
+    return df.with_columns(
+        (pl.col("pledge_contribution_arr_usd") * pledge_count / pl.col("pledge_count")).alias("pledge_contribution_arr_usd"),
+        pledge_count.alias("pledge_count"),
+    )
+
+
+def generate(scale, out_dir, seed = 0, source_dir = DATA_DIR):
+    """
+    Writes the synthetic datasets as parquet files into out_dir.
+
+    Parameters:
+    - scale (float): Size relative to the shipped data, e.g. 10 for ten times the pledges and payments.
+    - out_dir (str or Path): Directory to write, created if missing.
+    - seed (int): Seed of the id hashes which drive the sampling and jitter.
+    - source_dir (str or Path): Directory with the shipped datasets.
+
+    Returns:
+    - dict: Dataset name -> number of rows written.
+    """
+    if scale <= 0:
+        raise ValueError(f"scale must be positive, got {scale}")
+
+    os.makedirs(out_dir, exist_ok = True)
+    sources = {name: pl.read_parquet(os.path.join(source_dir, file_name)) for name, file_name in parquet_files.items()}
+
+    payment_dates = sources["payments"]["payment_date"]
+    date_range = (payment_dates.min(), payment_dates.max())
+
+    datasets = {
+        "merged": _generate_merged(sources["merged"], scale, seed, date_range),
+        "pledges": _generate_pledges(sources["pledges"], scale, seed),
+        "payments": _generate_payments(sources["payments"], scale, seed, date_range),
+        "pledge_active_arr": _generate_pledge_active_arr(sources["pledge_active_arr"], scale),
+    }
+
+    row_counts = {}
+    for name, df in datasets.items():
+        # Keep the exact schema of the shipped file
+        df = df.cast(sources[name].schema)
+        df.write_parquet(os.path.join(out_dir, parquet_files[name]))
+        row_counts[name] = df.height
+
+    return row_counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Generate synthetic OFTW datasets at a configurable scale.")
+    parser.add_argument("--scale", type = float, default = 10)
+    parser.add_argument("--out", required = True, help = "Output data directory, used as OFTW_DATA_DIR")
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    row_counts = generate(args.scale, args.out, args.seed)
+    for name, rows in row_counts.items():
+        print(f"{name}: {rows:,} rows")
+    print(f"Wrote synthetic data at scale {args.scale} to {args.out}")
@@ -0,0 +1,158 @@
+"""
+Lightweight per-request stage timings.
+
+Code marks its stages with the stage() context manager or the @timed decorator, e.g. stage("query") around a Polars
+collect. While a request is recorded, the time of every stage is summed per stage name; nested stages are exclusive,
+so "figure" does not include a "query" run inside the figure builder. Outside of a recorded request a stage costs two
+perf_counter calls.
+
+init_app(server) records every _dash-update-component request and reports it as a Server-Timing response header
+(visible in the browser dev tools) and as one JSON log line on the "oftw.timing" logger:
+
+    Server-Timing: query;dur=12.1, figure;dur=30.4, callback;dur=0.8, dash;dur=3.2;desc="dispatch and JSON serialization", total;dur=46.5
+
+Set SERVER_TIMING=0 to turn it off.
+"""
+import flask
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("oftw.timing")
+
+_current_timings = contextvars.ContextVar("oftw_timings", default = None)
+
+
+class RequestTimings:
+    """
+    Stage timings of one request: stage name -> exclusive milliseconds, and the number of times it ran.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations_ms = {}
+        self.counts = {}
+        self._child_ms = [0.0]     # time spent in child stages, per open stage
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def stages_ms(self):
+        return sum(self.durations_ms.values())
+
+
+@contextmanager
+def stage(name):
+    """
+    Records the time spent in the block under the stage name, if a request is being recorded.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    timings._child_ms.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        child_ms = timings._child_ms.pop()
+        timings._child_ms[-1] += duration_ms
+
+        timings.durations_ms[name] = timings.durations_ms.get(name, 0.0) + duration_ms - child_ms
+        timings.counts[name] = timings.counts.get(name, 0) + 1
+
+
+def timed(name):
+    """
+    Decorator recording every call of the function as the stage name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def record():
+    """
+    Records the stages run in the block, e.g. in a benchmark. Yields the RequestTimings.
+    """
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def server_timing_header(timings, total_ms):
+    """
+    Returns the Server-Timing header value of the recorded stages.
+    Everything outside of the stages (Dash dispatch, JSON serialization of the outputs) is reported as "dash".
+    """
+    metrics = [f"{name};dur={duration_ms:.1f}" for name, duration_ms in timings.durations_ms.items()]
+    metrics.append(f'dash;dur={max(total_ms - timings.stages_ms(), 0):.1f};desc="dispatch and JSON serialization"')
+    metrics.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(metrics)
+
+
+def init_app(server):
+    """
+    Records the stage timings of every Dash callback request on the Flask server.
+
+    Parameters:
+    - server (flask.Flask): The Dash app server.
+    """
+    if os.getenv("SERVER_TIMING", "1") == "0":
+        return
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    @server.before_request
+    def _start_timings():
+        if flask.request.path.endswith("_dash-update-component"):
+            flask.g.oftw_timings_token = _current_timings.set(RequestTimings())
+
+    @server.after_request
+    def _report_timings(response):
+        timings = _current_timings.get()
+        if timings is None or not flask.request.path.endswith("_dash-update-component"):
+            return response
+
+        total_ms = timings.total_ms()
+        response.headers.add("Server-Timing", server_timing_header(timings, total_ms))
+
+        body = flask.request.get_json(silent = True) or {}
+        logger.info(json.dumps({
+            "event": "callback_timing",
+            "output": body.get("output"),
+            "triggered": body.get("changedPropIds"),
+            "status": response.status_code,
+            "bytes": response.calculate_content_length(),
+            "total_ms": round(total_ms, 1),
+            "stages_ms": {name: round(duration_ms, 1) for name, duration_ms in timings.durations_ms.items()},
+            "stage_counts": timings.counts,
+        }))
+
+        return response
+
+    @server.teardown_request
+    def _clear_timings(exc):
+        token = flask.g.pop("oftw_timings_token", None)
+        if token is not None:
+            _current_timings.reset(token)